@@ -1,177 +1,227 @@
 # ===== CHOROPLETH MAP DATA FUNCTIONS =====
 
+import json
+import logging
+import os
+import textwrap
+import time
+from collections import namedtuple
+from dataclasses import dataclass
+from datetime import date
+from functools import cached_property
+
+import numpy as np
 import streamlit as st
 import pandas as pd
 from sqlalchemy import text
-from data_fetcher import engine
+from config import engine
+from data_fetcher import FAILURE_BACKOFF_SECONDS, read_sql_copy
 
-@st.cache_data(ttl=300)
-def get_measles_cumulative_cases_by_district():
+logger = logging.getLogger(__name__)
+
+# Window used by the "last 21 days" maps
+RECENT_WINDOW_DAYS = 21
+
+# Built once at import; dedented and stripped so no indentation is sent on the wire.
+# The maps look districts up by name, so rows come back unordered
+_DISTRICT_CASE_STATS_QUERY = text(textwrap.dedent("""
+SELECT
+    district_name,
+    SUM(cases) as total_cases,
+    COALESCE(SUM(cases) FILTER (
+        WHERE event_date >= CURRENT_DATE - :window_days
+    ), 0) as cases_last_21_days
+FROM dwh.fact_measles_daily_district
+GROUP BY district_name
+""").strip())
+
+
+# Immutable, column-per-field snapshot of the district statistics
+DistrictCaseStats = namedtuple('DistrictCaseStats', [
+    'districts', 'total_cases', 'cases_last_21_days',
+    'attack_rate_per_100k', 'current_rate_per_100k',
+])
+
+# The rollup is rebuilt once a day, so a fill stays valid until the next load;
+# keying on the calendar date rolls the 21-day window over at midnight
+STATS_CACHE_TTL = 3600
+
+# time.monotonic() of the last failed fetch; for FAILURE_BACKOFF_SECONDS afterwards the
+# empty snapshot is served instead of re-querying the database on every rerun
+_last_failure = None
+
+# MEASLES_DEBUG=1 logs the plan of each statistics query once per process
+DEBUG_PLANS = os.getenv('MEASLES_DEBUG') == '1'
+# Tables large enough that a sequential scan means an index stopped being used
+_SEQ_SCAN_WATCHLIST = {'fact_measles_daily_district'}
+_explained = set()
+
+# Denominator floors for the simple proportional per-100K rates
+CUMULATIVE_RATE_FLOOR = 1000
+CURRENT_RATE_FLOOR = 500
+
+
+@dataclass(frozen=True)
+class DistrictSeries:
     """
-    Get cumulative measles cases by district for choropleth map
-    Returns dictionary: {district_name: total_cases}
+    Column-oriented district values for a choropleth layer
+    names and values are parallel arrays; lookups by name build an index lazily
+    """
+    names: np.ndarray
+    values: np.ndarray
+
+    @cached_property
+    def _index(self):
+        return {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def get(self, name, default=0):
+        """Value for a single district, or default when it has no data"""
+        i = self._index.get(name)
+        return default if i is None else self.values[i]
+
+    def values_for(self, locations, default=0):
+        """Values aligned to the given district names (e.g. GeoJSON feature order)"""
+        index = self._index
+        positions = np.fromiter((index.get(loc, -1) for loc in locations), dtype=np.intp, count=len(locations))
+        aligned = np.full(len(locations), default, dtype=np.result_type(self.values.dtype, type(default)))
+        found = positions >= 0
+        aligned[found] = self.values[positions[found]]
+        return aligned
+
+
+def _build_district_case_stats(df):
+    """Turn the district case frame into a read-only DistrictCaseStats snapshot"""
+    # Case counts per district fit comfortably in int32, halving the cached arrays
+    total = df['total_cases'].to_numpy(dtype=np.int32)
+    current = df['cases_last_21_days'].to_numpy(dtype=np.int32)
+
+    # Rates are computed once per cache fill with vectorized NumPy rather than per row in SQL
+    stats = DistrictCaseStats(
+        districts=df['district_name'].to_numpy(dtype=object),
+        total_cases=total,
+        cases_last_21_days=current,
+        attack_rate_per_100k=np.round(total * 100000.0 / np.maximum(total, CUMULATIVE_RATE_FLOOR), 2),
+        current_rate_per_100k=np.round(current * 100000.0 / np.maximum(current, CURRENT_RATE_FLOOR), 2),
+    )
+    for column in stats:
+        column.flags.writeable = False
+    return stats
+
+
+def _plan_nodes(plan):
+    """Depth-first walk over the nodes of an EXPLAIN (FORMAT JSON) plan"""
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from _plan_nodes(child)
+
+
+def _log_plan(query, params):
     """
+    Log the node types of the query's executed plan and warn on sequential scans
+    of watched tables; runs once per statement and never raises
+    """
+    if query in _explained:
+        return
+    _explained.add(query)
+
     try:
         with engine.connect() as conn:
-            query = """
-            WITH measles_events AS (
-                SELECT DISTINCT 
-                    e.event_id,
-                    e.event_date,
-                    e.dim_org_hierarchy_key
-                FROM dwh.fact_eidsr_event_data e
-                WHERE e.data_element_id = 'qIlO7yEpiVv' AND e.data_value = 'Measles (B05.0_B05.9)'
-                  AND e.event_date IS NOT NULL
-            )
-            SELECT 
-                doh.district_name,
-                COUNT(DISTINCT me.event_id) as total_cases
-            FROM measles_events me
-            JOIN dwh.dim_eidsr_org_hierarchy doh ON me.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
-            WHERE doh.district_name IS NOT NULL
-              AND doh.district_name != 'Unknown'
-              AND doh.district_name != '1 Test District'
-            GROUP BY doh.district_name
-            ORDER BY total_cases DESC
-            """
-            
-            df = pd.read_sql_query(text(query), conn)
-            return dict(zip(df['district_name'], df['total_cases']))
-            
+            plan = conn.execute(text(f"EXPLAIN (FORMAT JSON, ANALYZE, BUFFERS) {query.text}"), params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        root = plan[0]['Plan']
+
+        nodes = list(_plan_nodes(root))
+        logger.info("District stats plan (%.1f ms): %s", root.get('Actual Total Time', 0.0),
+                    ' > '.join(node['Node Type'] for node in nodes))
+        for node in nodes:
+            if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') in _SEQ_SCAN_WATCHLIST:
+                logger.warning("Sequential scan on %s in district stats plan", node['Relation Name'])
+
     except Exception as e:
-        st.error(f"Error fetching cumulative cases by district: {str(e)}")
-        return {}
+        logger.warning("Could not explain district stats query: %s", e)
 
 
-@st.cache_data(ttl=300)
-def get_measles_districts_reporting_last_21_days():
+EMPTY_DISTRICT_CASE_STATS = _build_district_case_stats(
+    pd.DataFrame(columns=['district_name', 'total_cases', 'cases_last_21_days'])
+)
+
+
+@st.cache_resource(ttl=STATS_CACHE_TTL)
+def _fetch_district_case_stats(as_of):
     """
-    Get districts reporting cases in last 21 days for choropleth map
-    Returns dictionary: {district_name: case_count_last_21_days}
+    Get cumulative and last-21-day measles case counts by district in a single pass
+    over the daily district rollup; shared by all four choropleth maps.
+    Cached as a resource so cache hits skip st.cache_data's pickle/hash round-trip.
+    as_of only keys the cache so a new day starts a new entry. Errors propagate
+    so a failed fetch is never cached.
+    Returns DistrictCaseStats of parallel numpy arrays
+    """
+    query, params = _DISTRICT_CASE_STATS_QUERY, {'window_days': RECENT_WINDOW_DAYS}
+
+    if DEBUG_PLANS:
+        _log_plan(query, params)
+    df = read_sql_copy(query, params, dtype={'district_name': 'object', 'total_cases': 'int64', 'cases_last_21_days': 'int64'})
+    return _build_district_case_stats(df)
+
+
+def _get_district_case_stats():
+    """
+    Cached district statistics for today, or EMPTY_DISTRICT_CASE_STATS when the
+    database is unavailable (retried at most once per FAILURE_BACKOFF_SECONDS)
     """
+    global _last_failure
+
+    if _last_failure is not None and time.monotonic() - _last_failure < FAILURE_BACKOFF_SECONDS:
+        st.warning("District statistics temporarily unavailable; retrying shortly.")
+        return EMPTY_DISTRICT_CASE_STATS
+
     try:
-        with engine.connect() as conn:
-            query = """
-            WITH measles_events AS (
-                SELECT DISTINCT 
-                    e.event_id,
-                    e.event_date,
-                    e.dim_org_hierarchy_key
-                FROM dwh.fact_eidsr_event_data e
-                WHERE e.data_element_id = 'qIlO7yEpiVv' AND e.data_value = 'Measles (B05.0_B05.9)'
-                  AND e.event_date IS NOT NULL
-                  AND e.event_date >= CURRENT_DATE - INTERVAL '21 days'
-            )
-            SELECT 
-                doh.district_name,
-                COUNT(DISTINCT me.event_id) as cases_last_21_days
-            FROM measles_events me
-            JOIN dwh.dim_eidsr_org_hierarchy doh ON me.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
-            WHERE doh.district_name IS NOT NULL
-              AND doh.district_name != 'Unknown'
-              AND doh.district_name != '1 Test District'
-            GROUP BY doh.district_name
-            ORDER BY cases_last_21_days DESC
-            """
-            
-            df = pd.read_sql_query(text(query), conn)
-            return dict(zip(df['district_name'], df['cases_last_21_days']))
-            
+        return _fetch_district_case_stats(date.today())
+
     except Exception as e:
-        st.error(f"Error fetching districts reporting last 21 days: {str(e)}")
-        return {}
+        _last_failure = time.monotonic()
+        st.error(f"Error fetching district case statistics: {str(e)}")
+        return EMPTY_DISTRICT_CASE_STATS
+
+
+def get_measles_cumulative_cases_by_district():
+    """
+    Get cumulative measles cases by district for choropleth map
+    Returns DistrictSeries: names -> total_cases
+    """
+    stats = _get_district_case_stats()
+    return DistrictSeries(stats.districts, stats.total_cases)
+
+
+def get_measles_districts_reporting_last_21_days():
+    """
+    Get districts reporting cases in last 21 days for choropleth map
+    Returns DistrictSeries: names -> case_count_last_21_days
+    """
+    stats = _get_district_case_stats()
+    mask = stats.cases_last_21_days > 0
+    return DistrictSeries(stats.districts[mask], stats.cases_last_21_days[mask])
 
 
-@st.cache_data(ttl=300)
 def get_measles_attack_rates_by_district_cumulative():
     """
     Get cumulative attack rates per 100K population by district for choropleth map
-    Returns dictionary: {district_name: attack_rate_per_100k}
+    Returns DistrictSeries: names -> attack_rate_per_100k
     """
-    try:
-        with engine.connect() as conn:
-            query = """
-            WITH measles_events AS (
-                SELECT DISTINCT 
-                    e.event_id,
-                    e.event_date,
-                    e.dim_org_hierarchy_key
-                FROM dwh.fact_eidsr_event_data e
-                WHERE e.data_element_id = 'qIlO7yEpiVv' AND e.data_value = 'Measles (B05.0_B05.9)'
-                  AND e.event_date IS NOT NULL
-            ),
-            district_cases AS (
-                SELECT 
-                    doh.district_name,
-                    COUNT(DISTINCT me.event_id) as total_cases
-                FROM measles_events me
-                JOIN dwh.dim_eidsr_org_hierarchy doh ON me.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
-                WHERE doh.district_name IS NOT NULL
-                  AND doh.district_name != 'Unknown'
-                  AND doh.district_name != '1 Test District'
-                GROUP BY doh.district_name
-            )
-            SELECT 
-                district_name,
-                total_cases,
-                -- Simple attack rate calculation: cases per 100,000 as proportional rate
-                ROUND((total_cases * 100000.0 / GREATEST(total_cases, 1000)), 2) as attack_rate_per_100k
-            FROM district_cases
-            WHERE total_cases > 0
-            ORDER BY attack_rate_per_100k DESC
-            """
-            
-            df = pd.read_sql_query(text(query), conn)
-            return dict(zip(df['district_name'], df['attack_rate_per_100k']))
-            
-    except Exception as e:
-        st.error(f"Error fetching attack rates by district: {str(e)}")
-        return {}
+    stats = _get_district_case_stats()
+    mask = stats.total_cases > 0
+    return DistrictSeries(stats.districts[mask], stats.attack_rate_per_100k[mask])
 
 
-@st.cache_data(ttl=300)
 def get_measles_current_case_rates_by_district_21_days():
     """
     Get current case rates per 100K (last 21 days) by district for choropleth map
-    Returns dictionary: {district_name: current_rate_per_100k}
+    Returns DistrictSeries: names -> current_rate_per_100k
     """
-    try:
-        with engine.connect() as conn:
-            query = """
-            WITH measles_events AS (
-                SELECT DISTINCT 
-                    e.event_id,
-                    e.event_date,
-                    e.dim_org_hierarchy_key
-                FROM dwh.fact_eidsr_event_data e
-                WHERE e.data_element_id = 'qIlO7yEpiVv' AND e.data_value = 'Measles (B05.0_B05.9)'
-                  AND e.event_date IS NOT NULL
-                  AND e.event_date >= CURRENT_DATE - INTERVAL '21 days'
-            ),
-            district_current_cases AS (
-                SELECT 
-                    doh.district_name,
-                    COUNT(DISTINCT me.event_id) as current_cases
-                FROM measles_events me
-                JOIN dwh.dim_eidsr_org_hierarchy doh ON me.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
-                WHERE doh.district_name IS NOT NULL
-                  AND doh.district_name != 'Unknown'
-                  AND doh.district_name != '1 Test District'
-                GROUP BY doh.district_name
-            )
-            SELECT 
-                district_name,
-                current_cases,
-                -- Simple current rate calculation: cases per 100,000 as proportional rate
-                ROUND((current_cases * 100000.0 / GREATEST(current_cases, 500)), 2) as current_rate_per_100k
-            FROM district_current_cases
-            WHERE current_cases > 0
-            ORDER BY current_rate_per_100k DESC
-            """
-            
-            df = pd.read_sql_query(text(query), conn)
-            return dict(zip(df['district_name'], df['current_rate_per_100k']))
-            
-    except Exception as e:
-        st.error(f"Error fetching current case rates by district: {str(e)}")
-        return {}
\ No newline at end of file
+    stats = _get_district_case_stats()
+    mask = stats.cases_last_21_days > 0
+    return DistrictSeries(stats.districts[mask], stats.current_rate_per_100k[mask])
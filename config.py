@@ -1,14 +1,20 @@
+import logging
 import os
+import stat
+import time
+from pathlib import Path
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.orm import sessionmaker
-import psycopg2
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables from .env file
 load_dotenv(override=True)
 
 # Test connectivity to production server, fallback to localhost if not accessible
-def test_network_connectivity(host, port, timeout=5):
+def test_network_connectivity(host, port, timeout=1):
     import socket
     try:
         sock = socket.create_connection((host, int(port)), timeout=timeout)
@@ -17,12 +23,50 @@ def test_network_connectivity(host, port, timeout=5):
     except (socket.error, socket.timeout):
         return False
 
+# Positive reachability results shared across workers and restarts so cold starts skip
+# the TCP probe. Kept in a private (0700) directory under the app's own cache dir; a
+# failed probe is never stored, so one network blip cannot pin every worker to localhost
+HOST_CHOICE_DIR = Path(__file__).resolve().parent / '.cache' / 'host_probe'
+HOST_CHOICE_FILE = HOST_CHOICE_DIR / 'reachable'
+HOST_CHOICE_TTL = 600
+
+def _private_host_choice_dir():
+    """HOST_CHOICE_DIR, created 0700; None if it is not a directory owned by us and private"""
+    try:
+        HOST_CHOICE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        info = os.lstat(HOST_CHOICE_DIR)
+    except OSError:
+        return None
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        logger.warning("Ignoring host probe cache %s: not a private directory owned by this user", HOST_CHOICE_DIR)
+        return None
+    return HOST_CHOICE_DIR
+
+def is_host_reachable(host, port):
+    """Reachability of host:port, reusing a successful probe younger than HOST_CHOICE_TTL"""
+    key = f"{host}:{port}"
+    cache_dir = _private_host_choice_dir()
+    if cache_dir is not None:
+        try:
+            if time.time() - HOST_CHOICE_FILE.stat().st_mtime < HOST_CHOICE_TTL and HOST_CHOICE_FILE.read_text().strip() == key:
+                return True
+        except OSError:
+            pass
+
+    reachable = test_network_connectivity(host, port)
+    if reachable and cache_dir is not None:
+        try:
+            HOST_CHOICE_FILE.write_text(key)
+        except OSError as e:
+            logger.warning("Could not record host probe result: %s", e)
+    return reachable
+
 # Get production settings from .env
 PROD_HOST = os.getenv('DB_HOST')
 PROD_USER = os.getenv('DB_USER')
 
 # Test if production server is accessible
-if PROD_HOST and test_network_connectivity(PROD_HOST, os.getenv('DB_PORT', '5432')):
+if PROD_HOST and is_host_reachable(PROD_HOST, os.getenv('DB_PORT', '5432')):
     # Use production settings - you're on the network
     DB_HOST = PROD_HOST
     DB_USER = PROD_USER
@@ -38,37 +82,52 @@ else:
 DB_PORT = os.getenv('DB_PORT', '5432')
 DB_NAME = os.getenv('DB_NAME', 'uganda_dwh')
 
+# Secret for the ?clear_cache=<token> URL parameter; empty disables it
+CLEAR_CACHE_TOKEN = os.getenv('CLEAR_CACHE_TOKEN', '')
+
 # PostgreSQL connection string with timeout parameters
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?connect_timeout=30&application_name=disease_report_app"
 
 # SQLAlchemy engine with connection pooling and timeout settings
 engine = create_engine(
     DATABASE_URL,
-    pool_size=5,
-    max_overflow=10,
+    # Explicit so a NullPool (a new TCP connection per query) is never picked up by accident
+    poolclass=QueuePool,
+    pool_size=10,
+    max_overflow=20,
+    # Hand out the most recently returned connection so a page's burst of queries reuses warm ones
+    pool_use_lifo=True,
     pool_timeout=30,
-    pool_recycle=3600,
+    pool_recycle=1800,
     pool_pre_ping=True,
     connect_args={
         "connect_timeout": 30,
-        "options": "-c statement_timeout=60s",
+        # work_mem sized so the dashboard's hash aggregates stay in memory instead of spilling
+        "options": "-c statement_timeout=60s -c work_mem=64MB",
         "application_name": "disease_report_app"
     }
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def get_db_connection():
-    """Get a direct psycopg2 connection with timeout settings"""
-    return psycopg2.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        database=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        connect_timeout=30,
-        application_name="disease_report_app",
-        options="-c statement_timeout=60s"
-    )
+# Connections opened ahead of the first page run; matches the concurrent query
+# fan-out (data_fetcher.MAX_CONCURRENT_QUERIES) and stays within pool_size
+POOL_WARM_SIZE = 8
+
+def warm_pool(size=POOL_WARM_SIZE):
+    """
+    Open size connections and return them to the pool, so first queries skip connection setup
+    Called once per process by the app's startup hook (main_report); failures only mean
+    queries connect on demand as before
+    """
+    conns = []
+    try:
+        for _ in range(size):
+            conns.append(engine.connect())
+    except Exception as e:
+        logger.warning("Connection pool warm-up stopped after %d connections: %s", len(conns), e)
+    finally:
+        for conn in conns:
+            conn.close()
 
 def get_db_session():
     """Get SQLAlchemy session"""
@@ -82,13 +141,10 @@ def get_db_session():
 def test_connection():
     """Test database connection"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT version();")
-        version = cursor.fetchone()
-        print(f"Connected to PostgreSQL: {version[0]}")
-        cursor.close()
-        conn.close()
+        with engine.connect() as conn:
+            conn.exec_driver_sql("SELECT 1")
+        print(f"Connected to PostgreSQL at {DB_HOST}")
+        print(f"Connection pool: {engine.pool.status()}")
         return True
     except Exception as e:
         print(f"Connection failed: {e}")
@@ -1,15 +1,38 @@
+import hashlib
+import io
+import logging
+import numpy as np
+import os
 import pandas as pd
 import psycopg2
-from config import get_db_connection, engine
-from datetime import datetime, timedelta
+import random
+import tempfile
+from config import engine
+from datetime import date, datetime, timedelta
 import streamlit as st
 from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
 import time
-from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
+from pathlib import Path
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from types import MappingProxyType
 
-def db_retry(max_retries=3, delay=1, backoff=2):
+logger = logging.getLogger(__name__)
+
+def _is_transient_db_error(e):
+    """True for connection-level failures worth retrying, not for SQL or programming errors"""
+    if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+        return True
+    if isinstance(e, DBAPIError):
+        return e.connection_invalidated or isinstance(e.orig, (psycopg2.OperationalError, psycopg2.InterfaceError))
+    return False
+
+def db_retry(max_retries=3, delay=1, backoff=2, max_delay=30):
     """
-    Decorator to retry database operations with exponential backoff
+    Decorator to retry database operations with capped exponential backoff and jitter
+    Only connection-level errors are retried; anything else is raised immediately
     """
     def decorator(func):
         @wraps(func)
@@ -18,230 +41,290 @@ def db_retry(max_retries=3, delay=1, backoff=2):
             while retries < max_retries:
                 try:
                     return func(*args, **kwargs)
-                except (psycopg2.OperationalError, Exception) as e:
+                except (psycopg2.OperationalError, psycopg2.InterfaceError, DBAPIError) as e:
+                    if not _is_transient_db_error(e):
+                        raise
                     retries += 1
                     if retries == max_retries:
                         st.error(f"Database operation failed after {max_retries} attempts: {str(e)}")
                         raise e
                     
-                    wait_time = delay * (backoff ** (retries - 1))
-                    st.warning(f"Database timeout, retrying in {wait_time}s... (attempt {retries}/{max_retries})")
+                    # Jitter spreads out the retries of concurrent sessions after an outage
+                    wait_time = min(max_delay, delay * (backoff ** (retries - 1))) * random.uniform(0.5, 1.5)
+                    st.warning(f"Database timeout, retrying in {wait_time:.1f}s... (attempt {retries}/{max_retries})")
                     time.sleep(wait_time)
             return None
         return wrapper
     return decorator
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
-def get_measles_cases_last_24h():
+# Upper bound on queries a single page run sends to the database at once
+MAX_CONCURRENT_QUERIES = 8
+
+def fetch_concurrently(*calls):
     """
-    Get new measles cases reported in the last 24 hours
-    Uses the most recent date in database minus 1 day
-    
+    Run independent fetch functions in parallel, each on its own pooled connection
+    Wall time is the slowest query rather than the sum of all of them
+
+    Args:
+        *calls: Zero-argument callables, e.g. fetch functions or lambdas wrapping them
+
     Returns:
-        int: Number of new cases in last 24 hours
+        list: Results in the same order as calls
+    """
+    ctx = get_script_run_ctx()
+
+    def run(call):
+        # Attach the session so st.cache_data and st.error work inside the worker
+        add_script_run_ctx(ctx=ctx)
+        return call()
+
+    with ThreadPoolExecutor(max_workers=min(len(calls), MAX_CONCURRENT_QUERIES)) as executor:
+        return list(executor.map(run, calls))
+
+def read_sql_copy(query, params=None, dtype=None, settings=None):
     """
+    Run a SELECT through PostgreSQL COPY ... TO STDOUT and load the stream into a DataFrame
+    Avoids building a Python tuple per row the way pd.read_sql_query does; the CSV
+    stream is parsed by pyarrow's multithreaded reader
+    CSV carries no column types, so pass dtype for every column whose type matters
+    (a column of only NULLs has no type to infer). Date and timestamp columns do not
+    survive the round trip (timestamptz comes back in UTC): read those with
+    pd.read_sql_query instead
+
+    Args:
+        query (TextClause or str): SELECT statement, optionally with :name bind parameters
+        params (dict): Values for the bind parameters
+        dtype (dict): Column name -> pandas dtype of the result
+        settings (dict): Server settings for this query only, e.g. {'work_mem': '128MB'};
+            applied with set_config(..., true), so they end with the transaction
+
+    Returns:
+        pandas.DataFrame: Query result
+    """
+    if isinstance(query, str):
+        query = text(query)
+    # Compiled into psycopg2's %(name)s form
+    select_sql = str(query.compile(dialect=engine.dialect))
+
+    raw_conn = engine.raw_connection()
     try:
-        query = """
-        WITH latest_date AS (
-            SELECT MAX(e.event_date) as max_date
-            FROM dwh.fact_eidsr_event_data e
-            WHERE e.data_element_id = 'qIlO7yEpiVv' AND e.data_value = 'Measles (B05.0_B05.9)'
-              AND e.event_date IS NOT NULL
-        )
-        SELECT COUNT(DISTINCT e.event_id) as cases_24h
-        FROM dwh.fact_eidsr_event_data e, latest_date ld
-        WHERE e.data_element_id = 'qIlO7yEpiVv' AND e.data_value = 'Measles (B05.0_B05.9)'
-          AND e.event_date >= (ld.max_date - INTERVAL '1 day')
-          AND e.event_date IS NOT NULL
-        """
-        
-        with engine.connect() as connection:
-            result = pd.read_sql_query(query, connection)
-            
-        return int(result['cases_24h'].iloc[0]) if not result.empty else 0
-        
-    except Exception as e:
-        st.error(f"Error fetching 24h measles data: {str(e)}")
-        return 0
+        with raw_conn.cursor() as cursor:
+            for name, value in (settings or {}).items():
+                cursor.execute("SELECT set_config(%s, %s, true)", (name, value))
+            # COPY does not accept bind parameters, so let psycopg2 quote them into the statement
+            select_sql = cursor.mogrify(select_sql, params or {}).decode()
+            buffer = io.BytesIO()
+            # NULL is written as \N, so empty strings and text such as 'NA' or 'None' stay strings
+            cursor.copy_expert(rf"COPY ({select_sql}) TO STDOUT WITH (FORMAT CSV, HEADER, NULL '\N')", buffer)
+    finally:
+        raw_conn.close()
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes  
-def get_measles_total_deaths():
+    buffer.seek(0)
+    return pd.read_csv(buffer, engine='pyarrow', dtype=dtype, keep_default_na=False, na_values=[r'\N'])
+
+# Rows fetched per round trip by read_sql_streamed; per-case rows are a few narrow
+# columns, so a chunk stays in the low megabytes
+STREAM_CHUNKSIZE = 50000
+
+def read_sql_streamed(query, conn, params=None, chunksize=STREAM_CHUNKSIZE):
     """
-    Get total cumulative measles deaths from tracked entity attributes
+    Read a per-case query through a server-side cursor in chunks
+    Only one chunk of raw rows is held in Python at a time instead of the whole result.
+    Aggregated reads of a few hundred rows should use pd.read_sql_query directly,
+    since the named cursor costs extra round trips
     
+    Args:
+        query (TextClause): SELECT statement
+        conn (Connection): Open SQLAlchemy connection
+        params (dict): Values for the bind parameters
+        chunksize (int): Rows per fetch
+        
     Returns:
-        int: Total cumulative deaths
+        pandas.DataFrame: Query result
+    """
+    # max_row_buffer matches the chunk so each chunk is a single FETCH from the server
+    conn = conn.execution_options(stream_results=True, max_row_buffer=chunksize)
+    chunks = pd.read_sql_query(query, conn, params=params, chunksize=chunksize)
+    return pd.concat(chunks, ignore_index=True)
+
+# Parquet copies of heavy query results so a restarted app does not start cold
+RESULT_CACHE_DIR = Path(__file__).resolve().parent / '.cache'
+RESULT_CACHE_TTL = 300
+
+def _prune_result_cache(ttl):
+    """Delete parquet copies (and leftover temp files) older than ttl seconds"""
+    cutoff = time.time() - ttl
+    for path in RESULT_CACHE_DIR.glob('*.*'):
+        try:
+            if path.suffix in ('.parquet', '.tmp') and path.stat().st_mtime < cutoff:
+                path.unlink()
+        except FileNotFoundError:
+            pass  # Removed by another worker in the meantime
+        except OSError as e:
+            logger.warning("Could not delete stale result cache file %s: %s", path, e)
+
+def read_sql_cached(query, params=None, dtype=None, ttl=RESULT_CACHE_TTL):
     """
+    Run a query through read_sql_copy, reusing a parquet copy of its result for ttl seconds
+    The copy lives on disk, so it survives restarts and is shared by every worker;
+    copies older than ttl are deleted whenever a new one is written
+
+    Args:
+        query (str): SQL statement, optionally with :name bind parameters
+        params (dict): Values for the bind parameters
+        dtype (dict): Column name -> pandas dtype, as for read_sql_copy
+        ttl (int): Maximum age in seconds of a reusable parquet copy
+
+    Returns:
+        pandas.DataFrame: Query result
+    """
+    key = hashlib.blake2b(f"{query}|{sorted((params or {}).items())}".encode(), digest_size=16).hexdigest()
+    path = RESULT_CACHE_DIR / f"{key}.parquet"
+
     try:
-        # Simple approach using the text() wrapper for SQLAlchemy
-        from sqlalchemy import text
-        
-        query = text("""
-        WITH measles_events AS (
-            SELECT DISTINCT 
-                e1.tracked_entity_instance_id as entity_id, 
-                e1.event_date
-            FROM dwh.fact_eidsr_event_data e1
-            WHERE e1.data_element_id = 'qIlO7yEpiVv' AND e1.data_value = 'Measles (B05.0_B05.9)'
-              AND e1.event_date IS NOT NULL
-        )
-        SELECT COUNT(DISTINCT tea.entity_id) as total_deaths
-        FROM dwh.fact_eidsr_tracked_entity_attributes tea
-        INNER JOIN measles_events me ON tea.entity_id = me.entity_id
-        WHERE LOWER(tea.display_name) LIKE '%death%'
-          AND (LOWER(tea.attribute_value) LIKE '%death%' OR 
-               LOWER(tea.attribute_value) LIKE '%died%' OR 
-               LOWER(tea.attribute_value) LIKE '%dead%' OR
-               LOWER(tea.attribute_value) = 'yes')
-        """)
-        
-        with engine.connect() as connection:
-            result = pd.read_sql_query(query, connection)
-            
-        return int(result['total_deaths'].iloc[0]) if not result.empty else 0
-        
+        if time.time() - path.stat().st_mtime < ttl:
+            return pd.read_parquet(path)
+    except FileNotFoundError:
+        pass  # No copy yet: fall through to the database
+    except Exception as e:
+        logger.warning("Unreadable result cache file %s, querying the database: %s", path, e)
+
+    df = read_sql_copy(query, params, dtype=dtype)
+
+    tmp_path = None
+    try:
+        RESULT_CACHE_DIR.mkdir(exist_ok=True)
+        # A temp file unique to this writer, so workers filling the same key never share one
+        fd, tmp_path = tempfile.mkstemp(dir=RESULT_CACHE_DIR, prefix=f"{key}.", suffix='.tmp')
+        os.close(fd)
+        df.to_parquet(tmp_path, compression='zstd')
+        os.replace(tmp_path, path)
     except Exception as e:
-        st.error(f"Error fetching total measles deaths: {str(e)}")
-        return 0
+        # The disk copy is best effort; the in-memory cache still applies
+        logger.warning("Could not write result cache file %s: %s", path, e)
+        if tmp_path is not None:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass  # Already renamed or removed; any leftover is pruned with the stale copies
+
+    _prune_result_cache(ttl)
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes  
-def get_measles_deaths_by_district():
+    return df
+
+EMPTY_KPIS = {
+    'cases_24h': 0,
+    'total_deaths': 0,
+    'total_cases': 0,
+    'affected_districts': 0,
+    'cases_last_7_days': 0,
+    'cases_last_30_days': 0
+}
+
+@st.cache_data(ttl=300)  # Cache for 5 minutes
+def get_all_kpis():
     """
-    Get measles deaths by district for horizontal bar chart
+    Get every headline measles metric in one round trip and one pass over the events
+    The 24h window ends at the most recent date in the database, not today
     
     Returns:
-        pandas.DataFrame: Districts with death counts
+        dict: cases_24h, total_deaths, total_cases, affected_districts,
+              cases_last_7_days and cases_last_30_days
     """
     try:
-        from sqlalchemy import text
-        
+        # Death predicate matches the partial index tea_death_attr_idx (schema/indexes.sql)
         query = text("""
-        WITH measles_events AS (
-            SELECT DISTINCT 
-                e1.tracked_entity_instance_id as entity_id, 
-                e1.event_date,
-                e1.dim_org_hierarchy_key
-            FROM dwh.fact_eidsr_event_data e1
-            WHERE e1.data_element_id = 'qIlO7yEpiVv' AND e1.data_value = 'Measles (B05.0_B05.9)'
-              AND e1.event_date IS NOT NULL
+        WITH death_entities AS (
+            SELECT DISTINCT entity_id
+            FROM dwh.fact_eidsr_tracked_entity_attributes
+            WHERE LOWER(display_name) LIKE '%death%'
+              AND (LOWER(attribute_value) LIKE '%death%' OR 
+                   LOWER(attribute_value) LIKE '%died%' OR 
+                   LOWER(attribute_value) LIKE '%dead%' OR
+                   LOWER(attribute_value) = 'yes')
         ),
-        deaths_by_district AS (
+        events AS (
             SELECT 
-                oh.level_3 as district_name,
-                COUNT(DISTINCT tea.entity_id) as death_count
-            FROM dwh.fact_eidsr_tracked_entity_attributes tea
-            INNER JOIN measles_events me ON tea.entity_id = me.entity_id
-            INNER JOIN dwh.dim_org_hierarchy oh ON me.dim_org_hierarchy_key = oh.key
-            WHERE LOWER(tea.display_name) LIKE '%death%'
-              AND (LOWER(tea.attribute_value) LIKE '%death%' OR 
-                   LOWER(tea.attribute_value) LIKE '%died%' OR 
-                   LOWER(tea.attribute_value) LIKE '%dead%' OR
-                   LOWER(tea.attribute_value) = 'yes')
-              AND oh.level_3 IS NOT NULL
-            GROUP BY oh.level_3
-            HAVING COUNT(DISTINCT tea.entity_id) > 0
+                me.event_id,
+                me.tracked_entity_instance_id,
+                me.event_date,
+                doh.district_name,
+                doh.dim_org_hierarchy_key IS NOT NULL as has_org,
+                de.entity_id IS NOT NULL as is_death
+            FROM dwh.measles_events() me
+            LEFT JOIN dwh.dim_eidsr_org_hierarchy doh ON me.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
+            LEFT JOIN death_entities de ON me.tracked_entity_instance_id = de.entity_id
         )
         SELECT 
-            district_name as District,
-            death_count as Deaths
-        FROM deaths_by_district
-        ORDER BY death_count DESC
-        LIMIT 15
+            COUNT(DISTINCT event_id) FILTER (
+                WHERE event_date >= (SELECT MAX(event_date) FROM dwh.measles_events()) - INTERVAL '1 day'
+            ) as cases_24h,
+            COUNT(DISTINCT tracked_entity_instance_id) FILTER (WHERE is_death AND event_date IS NOT NULL) as total_deaths,
+            COUNT(DISTINCT event_id) FILTER (WHERE has_org) as total_cases,
+            COUNT(DISTINCT district_name) as affected_districts,
+            COUNT(DISTINCT event_id) FILTER (WHERE has_org AND event_date >= CURRENT_DATE - INTERVAL '7 days') as cases_last_7_days,
+            COUNT(DISTINCT event_id) FILTER (WHERE has_org AND event_date >= CURRENT_DATE - INTERVAL '30 days') as cases_last_30_days
+        FROM events
         """)
         
-        with engine.connect() as connection:
-            result = pd.read_sql_query(query, connection)
-            
-        return result if not result.empty else pd.DataFrame(columns=['District', 'Deaths'])
+        with engine.connect() as conn:
+            row = conn.execute(query).mappings().one()
+        
+        return {key: int(row[key] or 0) for key in EMPTY_KPIS}
         
     except Exception as e:
-        st.error(f"Error fetching measles deaths by district: {str(e)}")
-        return pd.DataFrame(columns=['District', 'Deaths'])
+        st.error(f"Error fetching headline measles metrics: {str(e)}")
+        return dict(EMPTY_KPIS)
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes  
-def get_measles_age_sex_distribution():
+def get_measles_cases_last_24h():
     """
-    Get measles age and sex distribution from tracked entity attributes
-    Uses cumulative data (no parameter filtering) as per requirements
+    Get new measles cases reported in the last 24 hours
+    Uses the most recent date in database minus 1 day
     
     Returns:
-        pandas.DataFrame: Age-sex distribution data
+        int: Number of new cases in last 24 hours
     """
-    try:
-        from sqlalchemy import text
-        
-        query = text("""
-        WITH measles_events AS (
-            SELECT DISTINCT 
-                e1.tracked_entity_instance_id as entity_id, 
-                e1.event_date
-            FROM dwh.fact_eidsr_event_data e1
-            WHERE e1.data_element_id = 'qIlO7yEpiVv' AND e1.data_value = 'Measles (B05.0_B05.9)'
-              AND e1.event_date IS NOT NULL
-        ),
-        age_data AS (
-            SELECT 
-                tea.entity_id,
-                CASE 
-                    WHEN tea.attribute_value ~ '^[0-9]+$' THEN 
-                        CASE 
-                            WHEN CAST(tea.attribute_value AS INTEGER) BETWEEN 0 AND 4 THEN '0-4'
-                            WHEN CAST(tea.attribute_value AS INTEGER) BETWEEN 5 AND 9 THEN '5-9'
-                            WHEN CAST(tea.attribute_value AS INTEGER) BETWEEN 10 AND 14 THEN '10-14'
-                            WHEN CAST(tea.attribute_value AS INTEGER) BETWEEN 15 AND 19 THEN '15-19'
-                            WHEN CAST(tea.attribute_value AS INTEGER) BETWEEN 20 AND 29 THEN '20-29'
-                            WHEN CAST(tea.attribute_value AS INTEGER) BETWEEN 30 AND 39 THEN '30-39'
-                            WHEN CAST(tea.attribute_value AS INTEGER) BETWEEN 40 AND 49 THEN '40-49'
-                            WHEN CAST(tea.attribute_value AS INTEGER) >= 50 THEN '50+'
-                            ELSE 'Unknown'
-                        END
-                    ELSE 'Unknown'
-                END as age_group
-            FROM dwh.fact_eidsr_tracked_entity_attributes tea
-            INNER JOIN measles_events me ON tea.entity_id = me.entity_id
-            WHERE LOWER(tea.display_name) LIKE '%age%'
-        ),
-        gender_data AS (
-            SELECT 
-                tea.entity_id,
-                CASE 
-                    WHEN LOWER(tea.attribute_value) IN ('male', 'm', '1') THEN 'Male'
-                    WHEN LOWER(tea.attribute_value) IN ('female', 'f', '2') THEN 'Female'
-                    ELSE 'Unknown'
-                END as gender
-            FROM dwh.fact_eidsr_tracked_entity_attributes tea
-            INNER JOIN measles_events me ON tea.entity_id = me.entity_id
-            WHERE LOWER(tea.display_name) LIKE '%sex%' OR LOWER(tea.display_name) LIKE '%gender%'
-        )
-        SELECT 
-            age_data.age_group,
-            COUNT(DISTINCT CASE WHEN gender_data.gender = 'Male' THEN age_data.entity_id END) as male_cases,
-            COUNT(DISTINCT CASE WHEN gender_data.gender = 'Female' THEN age_data.entity_id END) as female_cases
-        FROM age_data
-        LEFT JOIN gender_data ON age_data.entity_id = gender_data.entity_id
-        WHERE age_data.age_group != 'Unknown'
-        GROUP BY age_data.age_group
-        ORDER BY 
-            CASE age_data.age_group
-                WHEN '0-4' THEN 1
-                WHEN '5-9' THEN 2
-                WHEN '10-14' THEN 3
-                WHEN '15-19' THEN 4
-                WHEN '20-29' THEN 5
-                WHEN '30-39' THEN 6
-                WHEN '40-49' THEN 7
-                WHEN '50+' THEN 8
-            END
-        """)
-        
-        with engine.connect() as connection:
-            result = pd.read_sql_query(query, connection)
-            
-        return result if not result.empty else pd.DataFrame(columns=['age_group', 'male_cases', 'female_cases'])
+    return get_all_kpis()['cases_24h']
+
+def get_measles_total_deaths():
+    """
+    Get total cumulative measles deaths from tracked entity attributes
+    
+    Returns:
+        int: Total cumulative deaths
+    """
+    return get_all_kpis()['total_deaths']
+
+@st.cache_data(ttl=300)  # Cache for 5 minutes
+def get_latest_epi_week(year=None):
+    """
+    Get the ISO epi week of the most recent measles event and the week before it
+    Years are ISO week-numbering years, so 2024-12-31 is week 1 of 2025 and the week
+    before week 1 is week 52 or 53 of the previous year as the calendar has it
+    
+    Args:
+        year (int): Restrict to events in this calendar year; None for all years
         
-    except Exception as e:
-        st.error(f"Error fetching age-sex distribution: {str(e)}")
-        return pd.DataFrame(columns=['age_group', 'male_cases', 'female_cases'])
+    Returns:
+        dict: max_year, max_week, prev_year and prev_week (None when there are no events)
+    """
+    query = """
+    WITH latest AS (
+        SELECT MAX(event_date) as max_date
+        FROM dwh.measles_events()
+        WHERE event_date IS NOT NULL
+          AND (:year IS NULL OR EXTRACT(YEAR FROM event_date) = :year)
+    )
+    SELECT 
+        EXTRACT(ISOYEAR FROM max_date)::int as max_year,
+        EXTRACT(WEEK FROM max_date)::int as max_week,
+        EXTRACT(ISOYEAR FROM max_date - INTERVAL '7 days')::int as prev_year,
+        EXTRACT(WEEK FROM max_date - INTERVAL '7 days')::int as prev_week
+    FROM latest
+    """
+    
+    with engine.connect() as conn:
+        return dict(conn.execute(text(query), {'year': year}).mappings().one())
 
 @st.cache_data(ttl=300)  # Cache for 5 minutes
 def get_measles_top_10_districts(year=None):
@@ -252,91 +335,56 @@ def get_measles_top_10_districts(year=None):
         pandas.DataFrame: Top 12 districts with comprehensive measles data
     """
     try:
-        # Build year filter - no filter for cumulative data
-        if year is None:
-            year_filter = ""  # Get cumulative data from ALL years
-        else:
-            year_filter = f"AND EXTRACT(YEAR FROM e1.event_date) = {year}"
-        
         # More comprehensive query to handle the complex database structure
-        query = f"""
+        # A NULL :year keeps cumulative data from ALL years; one statement serves both cases
+        query = """
         WITH measles_events AS (
             SELECT DISTINCT 
                 e1.event_id, 
                 e1.event_date, 
                 e1.dim_org_hierarchy_key,
+                -- ISO week and its ISO year, matching get_latest_epi_week
                 EXTRACT(WEEK FROM e1.event_date) as epi_week,
-                EXTRACT(YEAR FROM e1.event_date) as year
-            FROM dwh.fact_eidsr_event_data e1
-            WHERE e1.data_element_id = 'qIlO7yEpiVv' AND e1.data_value = 'Measles (B05.0_B05.9)'
-              AND e1.event_date IS NOT NULL
-              {year_filter}
+                EXTRACT(ISOYEAR FROM e1.event_date) as iso_year
+            FROM dwh.measles_events() e1
+            WHERE e1.event_date IS NOT NULL
+              AND (:year IS NULL OR EXTRACT(YEAR FROM e1.event_date) = :year)
         ),
         death_events AS (
-            SELECT DISTINCT 
+            SELECT 
                 e2.event_id,
-                CASE 
+                MAX(CASE 
                     WHEN LOWER(e2.data_value) LIKE '%death%' OR LOWER(e2.data_value) LIKE '%died%' OR LOWER(e2.data_value) LIKE '%fatal%' THEN 1
                     ELSE 0
-                END as is_death
+                END) as is_death
             FROM dwh.fact_eidsr_event_data e2
             WHERE (e2.data_element_display_name LIKE '%outcome%' OR e2.data_element_display_name LIKE '%status%' OR e2.data_element_display_name LIKE '%result%')
+            GROUP BY e2.event_id
         ),
-        latest_epi_week AS (
-            SELECT MAX(year) as max_year, MAX(epi_week) as max_week
-            FROM measles_events
-        ),
-        previous_epi_week AS (
+        -- One row per (district, event); the week bounds are bound as constants
+        district_events AS (
             SELECT 
-                lew.max_year,
-                CASE 
-                    WHEN lew.max_week = 1 THEN 52
-                    ELSE lew.max_week - 1
-                END as prev_week,
-                CASE 
-                    WHEN lew.max_week = 1 THEN lew.max_year - 1
-                    ELSE lew.max_year
-                END as prev_year
-            FROM latest_epi_week lew
-        ),
-        district_data AS (
-            SELECT 
-                COALESCE(doh.district_name, 'Unknown District') as district_name,
+                doh.district_name,
                 me.event_id,
-                me.epi_week,
-                me.year,
-                COALESCE(de.is_death, 0) as is_death,
-                lew.max_week,
-                lew.max_year,
-                pew.prev_week,
-                pew.prev_year
+                BOOL_OR(me.iso_year = :max_year AND me.epi_week = :max_week) as in_last_epiweek,
+                BOOL_OR(me.iso_year = :prev_year AND me.epi_week = :prev_week) as in_prev_epiweek,
+                MAX(COALESCE(de.is_death, 0)) as is_death
             FROM measles_events me
-            LEFT JOIN dwh.dim_eidsr_org_hierarchy doh ON me.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
+            JOIN dwh.dim_eidsr_org_hierarchy doh ON me.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
             LEFT JOIN death_events de ON me.event_id = de.event_id
-            CROSS JOIN latest_epi_week lew
-            CROSS JOIN previous_epi_week pew
             WHERE doh.district_name IS NOT NULL AND doh.district_name != 'Unknown'
+            GROUP BY doh.district_name, me.event_id
         ),
         district_summary AS (
             SELECT 
-                dd.district_name,
-                COUNT(DISTINCT dd.event_id) as total_cases,
-                SUM(dd.is_death) as total_deaths,
-                COUNT(DISTINCT CASE 
-                    WHEN dd.year = dd.max_year AND dd.epi_week = dd.max_week 
-                    THEN dd.event_id 
-                END) as cases_last_epiweek,
-                SUM(CASE 
-                    WHEN dd.year = dd.max_year AND dd.epi_week = dd.max_week 
-                    THEN dd.is_death 
-                    ELSE 0 
-                END) as deaths_last_epiweek,
-                COUNT(DISTINCT CASE 
-                    WHEN dd.year = dd.prev_year AND dd.epi_week = dd.prev_week 
-                    THEN dd.event_id 
-                END) as cases_prev_epiweek
-            FROM district_data dd
-            GROUP BY dd.district_name
+                de.district_name,
+                COUNT(*) as total_cases,
+                SUM(de.is_death) as total_deaths,
+                COUNT(*) FILTER (WHERE de.in_last_epiweek) as cases_last_epiweek,
+                COALESCE(SUM(de.is_death) FILTER (WHERE de.in_last_epiweek), 0) as deaths_last_epiweek,
+                COUNT(*) FILTER (WHERE de.in_prev_epiweek) as cases_prev_epiweek
+            FROM district_events de
+            GROUP BY de.district_name
         )
         SELECT 
             ds.district_name as "District",
@@ -359,10 +407,11 @@ def get_measles_top_10_districts(year=None):
         LIMIT 12
         """
         
-        with engine.connect() as conn:
-            df = pd.read_sql_query(text(query), conn)
-        
-        return df
+        return read_sql_cached(
+            query,
+            {'year': year, **get_latest_epi_week(year)},
+            dtype={'District': 'object', 'Percentage Change in Cases': 'float64'}
+        )
         
     except Exception as e:
         st.error(f"Error fetching measles district data: {str(e)}")
@@ -376,48 +425,36 @@ def get_measles_summary_stats(start_date=None, end_date=None):
     Returns:
         dict: Summary statistics
     """
+    # The unfiltered stats are part of the batched headline query
+    if start_date is None and end_date is None:
+        kpis = get_all_kpis()
+        return {key: kpis[key] for key in ('total_cases', 'affected_districts', 'cases_last_7_days', 'cases_last_30_days')}
+    
     try:
-        conn = get_db_connection()
-        
         query = """
         WITH measles_events AS (
             SELECT DISTINCT event_id, event_date, dim_org_hierarchy_key
-            FROM dwh.fact_eidsr_event_data 
-            WHERE data_element_id = 'qIlO7yEpiVv' AND data_value = 'Measles (B05.0_B05.9)'
+            FROM dwh.measles_events()
+            WHERE (:start_date IS NULL OR event_date >= :start_date)
+              AND (:end_date IS NULL OR event_date <= :end_date)
         )
         SELECT 
             COUNT(DISTINCT me.event_id) as total_cases,
             COUNT(DISTINCT doh.district_name) as affected_districts,
-            COUNT(DISTINCT CASE WHEN me.event_date >= CURRENT_DATE - INTERVAL '7 days' THEN me.event_id END) as cases_last_7_days,
-            COUNT(DISTINCT CASE WHEN me.event_date >= CURRENT_DATE - INTERVAL '30 days' THEN me.event_id END) as cases_last_30_days
+            COUNT(DISTINCT me.event_id) FILTER (WHERE me.event_date >= CURRENT_DATE - INTERVAL '7 days') as cases_last_7_days,
+            COUNT(DISTINCT me.event_id) FILTER (WHERE me.event_date >= CURRENT_DATE - INTERVAL '30 days') as cases_last_30_days
         FROM measles_events me
         JOIN dwh.dim_eidsr_org_hierarchy doh ON me.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
         """
         
-        # Add date filtering if provided - modify the CTE
-        date_filter = ""
-        if start_date and end_date:
-            date_filter = f" AND event_date BETWEEN '{start_date}' AND '{end_date}'"
-        elif start_date:
-            date_filter = f" AND event_date >= '{start_date}'"
-        elif end_date:
-            date_filter = f" AND event_date <= '{end_date}'"
-            
-        # Insert date filter into the CTE
-        if date_filter:
-            query = query.replace(
-                "AND data_value LIKE '%Measles%'", 
-                f"AND data_value LIKE '%Measles%'{date_filter}"
-            )
-        
         with engine.connect() as conn:
-            result = conn.execute(text(query)).fetchone()
+            row = conn.execute(text(query), {'start_date': start_date, 'end_date': end_date}).mappings().one()
         
         return {
-            'total_cases': result[0] or 0,
-            'affected_districts': result[1] or 0,
-            'cases_last_7_days': result[2] or 0,
-            'cases_last_30_days': result[3] or 0
+            'total_cases': row['total_cases'] or 0,
+            'affected_districts': row['affected_districts'] or 0,
+            'cases_last_7_days': row['cases_last_7_days'] or 0,
+            'cases_last_30_days': row['cases_last_30_days'] or 0
         }
         
     except Exception as e:
@@ -445,9 +482,10 @@ def get_measles_weekly_data(year=None, start_date=None, end_date=None):
             query = """
             WITH all_measles_events AS (
                 SELECT DISTINCT event_id, event_date
-                FROM dwh.fact_eidsr_event_data 
-                WHERE data_element_id = 'qIlO7yEpiVv' AND data_value = 'Measles (B05.0_B05.9)'
-                  AND event_date IS NOT NULL
+                FROM dwh.measles_events()
+                WHERE event_date IS NOT NULL
+                  AND (:start_date IS NULL OR event_date >= :start_date)
+                  AND (:end_date IS NULL OR event_date <= :end_date)
             ),
             all_weekly_data AS (
                 SELECT 
@@ -457,27 +495,18 @@ def get_measles_weekly_data(year=None, start_date=None, end_date=None):
                 FROM all_measles_events ame
                 GROUP BY EXTRACT(YEAR FROM ame.event_date), EXTRACT(WEEK FROM ame.event_date)
             ),
-            ordered_all_data AS (
-                SELECT 
-                    awd.*,
-                    ROW_NUMBER() OVER (ORDER BY awd.year DESC, awd.epi_week DESC) as rn
-                FROM all_weekly_data awd
-                ORDER BY awd.year DESC, awd.epi_week DESC
-                LIMIT 10
-            ),
             cumulative_all_data AS (
                 SELECT 
-                    oad.*,
-                    -- Calculate cumulative cases from the VERY BEGINNING of all data
-                    (SELECT SUM(awd2.weekly_cases) 
-                     FROM all_weekly_data awd2 
-                     WHERE (awd2.year < oad.year) 
-                        OR (awd2.year = oad.year AND awd2.epi_week <= oad.epi_week)
+                    awd.*,
+                    -- Running total from the VERY BEGINNING of all data, in one pass
+                    SUM(awd.weekly_cases) OVER (
+                        ORDER BY awd.year, awd.epi_week 
+                        ROWS UNBOUNDED PRECEDING
                     ) as cumulative_cases,
-                    LAG(oad.weekly_cases) OVER (
-                        ORDER BY oad.year DESC, oad.epi_week DESC
+                    LAG(awd.weekly_cases) OVER (
+                        ORDER BY awd.year DESC, awd.epi_week DESC
                     ) as prev_week_cases
-                FROM ordered_all_data oad
+                FROM all_weekly_data awd
             )
             SELECT 
                 cad.year as "Year",
@@ -493,19 +522,22 @@ def get_measles_weekly_data(year=None, start_date=None, end_date=None):
                 END as "Percent Change (%)"
             FROM cumulative_all_data cad
             ORDER BY cad.year DESC, cad.epi_week DESC
+            LIMIT 10
             """
         else:
             # Original query for specific year
-            query = f"""
+            query = """
             WITH measles_events AS (
                 SELECT DISTINCT event_id, event_date
-                FROM dwh.fact_eidsr_event_data 
-                WHERE data_element_id = 'qIlO7yEpiVv' AND data_value = 'Measles (B05.0_B05.9)'
+                FROM dwh.measles_events()
+                WHERE event_date IS NOT NULL
+                  AND (:start_date IS NULL OR event_date >= :start_date)
+                  AND (:end_date IS NULL OR event_date <= :end_date)
             ),
             target_year AS (
                 SELECT 
                     CASE 
-                        WHEN {year} IS NOT NULL THEN {year}
+                        WHEN :year IS NOT NULL THEN :year
                         ELSE MAX(EXTRACT(YEAR FROM me.event_date))
                     END as target_year_value
                 FROM measles_events me
@@ -523,23 +555,17 @@ def get_measles_weekly_data(year=None, start_date=None, end_date=None):
                 ORDER BY year DESC, epi_week DESC
                 LIMIT 10
             ),
-            ordered_data AS (
-                SELECT 
-                    wd.*,
-                    ROW_NUMBER() OVER (ORDER BY wd.year DESC, wd.epi_week DESC) as rn
-                FROM weekly_data wd
-            ),
             cumulative_data AS (
                 SELECT 
-                    od.*,
-                    SUM(od.weekly_cases) OVER (
-                        ORDER BY od.year, od.epi_week 
+                    wd.*,
+                    SUM(wd.weekly_cases) OVER (
+                        ORDER BY wd.year, wd.epi_week 
                         ROWS UNBOUNDED PRECEDING
                     ) as cumulative_cases,
-                    LAG(od.weekly_cases) OVER (
-                        ORDER BY od.year DESC, od.epi_week DESC
+                    LAG(wd.weekly_cases) OVER (
+                        ORDER BY wd.year DESC, wd.epi_week DESC
                     ) as prev_week_cases
-                FROM ordered_data od
+                FROM weekly_data wd
             )
             SELECT 
                 cd.year as "Year",
@@ -557,25 +583,11 @@ def get_measles_weekly_data(year=None, start_date=None, end_date=None):
             ORDER BY cd.year DESC, cd.epi_week DESC
             """
         
-        # Add date filtering if provided (for backward compatibility)
-        if start_date or end_date:
-            date_conditions = []
-            if start_date:
-                date_conditions.append(f"event_date >= '{start_date}'")
-            if end_date:
-                date_conditions.append(f"event_date <= '{end_date}'")
-            
-            if date_conditions:
-                additional_filter = " AND " + " AND ".join(date_conditions)
-                query = query.replace(
-                    "WHERE data_element_id = 'qIlO7yEpiVv' AND data_value = 'Measles (B05.0_B05.9)'",
-                    f"WHERE data_element_id = 'qIlO7yEpiVv' AND data_value = 'Measles (B05.0_B05.9)'{additional_filter}"
-                )
-        
-        with engine.connect() as conn:
-            df = pd.read_sql_query(text(query), conn)
-        
-        return df
+        return read_sql_cached(
+            query,
+            {'year': year, 'start_date': start_date, 'end_date': end_date},
+            dtype={'Percent Change (%)': 'float64'}
+        )
         
     except Exception as e:
         st.error(f"Error fetching weekly measles data: {str(e)}")
@@ -590,60 +602,43 @@ def get_location_options():
         dict: Dictionary with regions and districts
     """
     try:
-        with engine.connect() as conn:
-            # Get regions
-            regions_query = """
-            SELECT DISTINCT region_name 
+        # Regions and the top districts (those with measles cases) in one round trip;
+        # each branch is parenthesized so its own ORDER BY/LIMIT applies before the union
+        query = """
+        (
+            SELECT DISTINCT 'region' as kind, region_name as name, 0 as cases
             FROM dwh.dim_eidsr_org_hierarchy 
             WHERE region_name IS NOT NULL 
               AND region_name != 'unknown'
-            ORDER BY region_name
-            """
-            regions_df = pd.read_sql_query(text(regions_query), conn)
-            
-            # Get districts
-            districts_query = """
-            SELECT DISTINCT district_name 
-            FROM dwh.dim_eidsr_org_hierarchy 
-            WHERE district_name IS NOT NULL 
-              AND district_name != '1 Test District'
-            ORDER BY district_name
-            """
-            districts_df = pd.read_sql_query(text(districts_query), conn)
-            
-            # Combine into location options
-            locations = ["Uganda (National)"]
-            
-            # Add regions
-            for region in regions_df['region_name'].tolist():
-                locations.append(f"{region} Region")
-            
-            # Add top districts (those with measles cases)
-            top_districts_query = """
-            WITH measles_events AS (
-                SELECT DISTINCT event_id, dim_org_hierarchy_key
-                FROM dwh.fact_eidsr_event_data 
-                WHERE data_element_id = 'qIlO7yEpiVv' AND data_value = 'Measles (B05.0_B05.9)'
-            )
+        )
+        UNION ALL
+        (
             SELECT 
-                doh.district_name,
+                'top_district' as kind,
+                doh.district_name as name,
                 COUNT(DISTINCT me.event_id) as cases
-            FROM measles_events me
+            FROM dwh.measles_events() me
             JOIN dwh.dim_eidsr_org_hierarchy doh ON me.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
             WHERE doh.district_name IS NOT NULL
             GROUP BY doh.district_name
-            HAVING COUNT(DISTINCT me.event_id) > 0
             ORDER BY cases DESC
             LIMIT 15
-            """
-            top_districts_df = pd.read_sql_query(text(top_districts_query), conn)
-            
-            # Add top districts
-            for district in top_districts_df['district_name'].tolist():
-                locations.append(f"{district}")
-                
-            return locations
-            
+        )
+        """
+        
+        with engine.connect() as conn:
+            df = pd.read_sql_query(text(query), conn)
+        
+        regions = df.loc[df['kind'] == 'region', 'name'].sort_values()
+        top_districts = df.loc[df['kind'] == 'top_district'].sort_values('cases', ascending=False, kind='stable')
+        
+        # Combine into location options
+        locations = ["Uganda (National)"]
+        locations.extend(f"{region} Region" for region in regions)
+        locations.extend(top_districts['name'].tolist())
+        
+        return locations
+        
     except Exception as e:
         st.error(f"Error fetching location options: {str(e)}")
         return ["Uganda (National)"]
@@ -658,124 +653,54 @@ def get_time_period_options():
         dict: Dictionary with years and months
     """
     try:
-        # Force reload environment variables to ensure .env is used
-        import os
-        from dotenv import load_dotenv
-        from sqlalchemy import create_engine
+        query = """
+        WITH measles_events AS (
+            SELECT DISTINCT event_id, event_date
+            FROM dwh.measles_events()
+        )
+        SELECT 
+            EXTRACT(YEAR FROM me.event_date) as year,
+            EXTRACT(MONTH FROM me.event_date) as month,
+            TO_CHAR(me.event_date, 'Month') as month_name,
+            COUNT(DISTINCT me.event_id) as cases
+        FROM measles_events me
+        WHERE me.event_date IS NOT NULL
+        GROUP BY EXTRACT(YEAR FROM me.event_date), EXTRACT(MONTH FROM me.event_date), TO_CHAR(me.event_date, 'Month')
+        ORDER BY year DESC, month DESC
+        """
         
-        load_dotenv(override=True)  # Force reload .env file
+        # Use the shared pooled engine; the connection goes back to the pool before post-processing
+        with engine.connect() as conn:
+            df = pd.read_sql_query(text(query), conn)
         
-        DB_HOST = os.getenv('DB_HOST')
-        DB_USER = os.getenv('DB_USER')
-        DB_PASSWORD = os.getenv('DB_PASSWORD', '')
-        DB_PORT = os.getenv('DB_PORT', '5432')
-        DB_NAME = os.getenv('DB_NAME', 'uganda_dwh')
+        years = sorted(df['year'].unique(), reverse=True)
+        months_data = {int(year): [] for year in years}
         
-        DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+        # Rows arrive ordered by year and month descending; iterate plain column lists
+        # rather than boxing each row into a Series
+        month_names = df['month_name'].str.strip().tolist()
+        for year, month, month_name, cases in zip(df['year'].tolist(), df['month'].tolist(), month_names, df['cases'].tolist()):
+            months_data[int(year)].append({
+                'month': int(month),
+                'name': month_name,
+                'cases': cases,
+                'display': f"{month_name} {int(year)}"  # Remove case counts from display
+            })
         
-        # Create fresh engine with .env values
-        fresh_engine = create_engine(DATABASE_URL)
-        with fresh_engine.connect() as conn:
-            query = """
-            WITH measles_events AS (
-                SELECT DISTINCT event_id, event_date
-                FROM dwh.fact_eidsr_event_data 
-                WHERE data_element_id = 'qIlO7yEpiVv' AND data_value = 'Measles (B05.0_B05.9)'
-            )
-            SELECT 
-                EXTRACT(YEAR FROM me.event_date) as year,
-                EXTRACT(MONTH FROM me.event_date) as month,
-                TO_CHAR(me.event_date, 'Month') as month_name,
-                COUNT(DISTINCT me.event_id) as cases
-            FROM measles_events me
-            WHERE me.event_date IS NOT NULL
-            GROUP BY EXTRACT(YEAR FROM me.event_date), EXTRACT(MONTH FROM me.event_date), TO_CHAR(me.event_date, 'Month')
-            ORDER BY year DESC, month DESC
-            """
-            df = pd.read_sql_query(text(query), conn)
-            
-            years = sorted(df['year'].unique(), reverse=True)
-            months_data = {}
-            
-            for year in years:
-                year_months = df[df['year'] == year]
-                months_data[int(year)] = []
-                for _, row in year_months.iterrows():
-                    month_name = row['month_name'].strip()
-                    cases = row['cases']
-                    months_data[int(year)].append({
-                        'month': int(row['month']),
-                        'name': month_name,
-                        'cases': cases,
-                        'display': f"{month_name} {int(year)}"  # Remove case counts from display
-                    })
-            
-            return {
-                'years': [int(y) for y in years],
-                'months_data': months_data
-            }
+        return {
+            'years': [int(y) for y in years],
+            'months_data': months_data
+        }
             
     except Exception as e:
         st.error(f"Error fetching time period options: {str(e)}")
-        from datetime import datetime
         current_year = datetime.now().year
         return {
             'years': [current_year],
             'months_data': {current_year: [{'month': 1, 'name': 'January', 'cases': 0, 'display': f'January {current_year} (0 cases)'}]}
         }
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes 
-@db_retry(max_retries=3, delay=2, backoff=2)
-def get_hierarchical_locations():
-    """
-    Get national level and individual district names
-    
-    Returns:
-        list: List with national level and individual districts
-    """
-    try:
-        with engine.connect() as conn:
-            # Get national level and all districts with optimized query
-            query = """
-            SELECT DISTINCT 
-                district_name,
-                leaf_level
-            FROM dwh.dim_eidsr_org_hierarchy 
-            WHERE district_name IS NOT NULL 
-              AND district_name != 'Unknown'
-              AND district_name != '1 Test District'
-              AND leaf_level IN (1, 3)
-            ORDER BY 
-                leaf_level ASC,
-                district_name ASC
-            """
-            df = pd.read_sql_query(text(query), conn, params=None)
-            
-            locations = []
-            
-            # Add national level first
-            locations.append("National Level (MOH)")
-            
-            # Add individual districts
-            districts = df[df['leaf_level'] == 3]['district_name'].unique()
-            for district in sorted(districts):
-                locations.append(district)
-            
-            # If no districts found, provide defaults
-            if len(locations) <= 1:  # Only national level found
-                locations.extend([
-                    "Abim District",
-                    "Adjumani District", 
-                    "Kampala District"
-                ])
-            
-            return locations
-            
-    except Exception as e:
-        st.error(f"Error fetching hierarchical locations: {str(e)}")
-        return ["National Level", "Regional Level", "District Level", "Subcounty Level", "Facility Level"]
-
-@st.cache_data(ttl=1)  # Cache for 1 second to allow testing
+@st.cache_data(ttl=3600)  # Cache for 1 hour
 def explore_demographic_data_elements():
     """
     Explore the database to find age and sex related data elements
@@ -789,9 +714,19 @@ def explore_demographic_data_elements():
             explore_query = """
             WITH measles_events AS (
                 SELECT DISTINCT event_id
-                FROM dwh.fact_eidsr_event_data 
-                WHERE data_element_id = 'qIlO7yEpiVv' AND data_value = 'Measles (B05.0_B05.9)'
+                FROM dwh.measles_events()
                 LIMIT 100  -- Sample first 100 events
+            ),
+            -- Name patterns are matched against the small data element lookup, not the fact table
+            demographic_elements AS (
+                SELECT data_element_id, data_element_display_name
+                FROM dwh.dim_data_elements
+                WHERE data_element_display_name ILIKE '%age%'
+                   OR data_element_display_name ILIKE '%sex%'
+                   OR data_element_display_name ILIKE '%gender%'
+                   OR data_element_display_name ILIKE '%male%'
+                   OR data_element_display_name ILIKE '%female%'
+                   OR data_element_display_name ILIKE '%demographic%'
             )
             SELECT DISTINCT 
                 fed.data_element_display_name,
@@ -800,12 +735,10 @@ def explore_demographic_data_elements():
                 STRING_AGG(DISTINCT SUBSTR(fed.data_value, 1, 50), ' | ' ORDER BY SUBSTR(fed.data_value, 1, 50)) as sample_values
             FROM measles_events me
             JOIN dwh.fact_eidsr_event_data fed ON me.event_id = fed.event_id
-            WHERE fed.data_element_display_name ILIKE '%age%'
-               OR fed.data_element_display_name ILIKE '%sex%'
-               OR fed.data_element_display_name ILIKE '%gender%'
-               OR fed.data_element_display_name ILIKE '%male%'
-               OR fed.data_element_display_name ILIKE '%female%'
-               OR fed.data_element_display_name ILIKE '%demographic%'
+            JOIN demographic_elements de ON (
+                fed.data_element_id = de.data_element_id
+                AND fed.data_element_display_name = de.data_element_display_name
+            )
             GROUP BY fed.data_element_display_name
             ORDER BY event_count DESC
             """
@@ -816,8 +749,7 @@ def explore_demographic_data_elements():
             all_elements_query = """
             WITH measles_events AS (
                 SELECT DISTINCT event_id
-                FROM dwh.fact_eidsr_event_data 
-                WHERE data_element_id = 'qIlO7yEpiVv' AND data_value = 'Measles (B05.0_B05.9)'
+                FROM dwh.measles_events()
                 LIMIT 50  -- Sample first 50 events
             )
             SELECT DISTINCT 
@@ -854,104 +786,26 @@ def get_measles_demographic_data(start_date=None, end_date=None):
     """
     try:
         with engine.connect() as conn:
-            # Enhanced query that calculates age from date of birth
+            # Age and sex are parsed once per event in dwh.mv_measles_demographics
+            # (schema/materialized_views.sql); only the bucketing happens here
             combined_query = """
-            WITH measles_events AS (
-                SELECT DISTINCT e.event_id, e.event_date, e.dim_org_hierarchy_key
-                FROM dwh.fact_eidsr_event_data e
-                WHERE e.data_element_id = 'qIlO7yEpiVv' AND e.data_value = 'Measles (B05.0_B05.9)'
-            ),
-            demographic_data AS (
-                SELECT DISTINCT 
-                    me.event_id,
-                    me.event_date,
-                    -- Try to find date of birth from various possible field names
-                    COALESCE(
-                        dob1.data_value,
-                        dob2.data_value,
-                        dob3.data_value,
-                        age_direct.data_value
-                    ) as birth_or_age_value,
-                    -- Try to find sex/gender from various possible field names
-                    COALESCE(
-                        sex1.data_value,
-                        sex2.data_value,
-                        sex3.data_value,
-                        'Unknown'
-                    ) as sex_value
-                FROM measles_events me
-                -- Multiple attempts to find date of birth
-                LEFT JOIN dwh.fact_eidsr_event_data dob1 ON me.event_id = dob1.event_id 
-                    AND (dob1.data_element_display_name ILIKE '%birth%' OR dob1.data_element_display_name ILIKE '%dob%')
-                LEFT JOIN dwh.fact_eidsr_event_data dob2 ON me.event_id = dob2.event_id 
-                    AND dob2.data_element_display_name ILIKE '%date%birth%'
-                LEFT JOIN dwh.fact_eidsr_event_data dob3 ON me.event_id = dob3.event_id 
-                    AND dob3.data_element_display_name ILIKE '%birth%date%'
-                -- Fallback to direct age if no DOB found
-                LEFT JOIN dwh.fact_eidsr_event_data age_direct ON me.event_id = age_direct.event_id 
-                    AND age_direct.data_element_display_name ILIKE '%age%'
-                -- Multiple attempts to find sex/gender
-                LEFT JOIN dwh.fact_eidsr_event_data sex1 ON me.event_id = sex1.event_id 
-                    AND sex1.data_element_display_name ILIKE '%sex%'
-                LEFT JOIN dwh.fact_eidsr_event_data sex2 ON me.event_id = sex2.event_id 
-                    AND sex2.data_element_display_name ILIKE '%gender%'
-                LEFT JOIN dwh.fact_eidsr_event_data sex3 ON me.event_id = sex3.event_id 
-                    AND (sex3.data_element_display_name ILIKE '%male%' OR sex3.data_element_display_name ILIKE '%female%')
-            ),
-            processed_demographics AS (
-                SELECT 
-                    event_id,
-                    birth_or_age_value,
-                    sex_value,
-                    -- Calculate age from date of birth or use direct age
-                    CASE 
-                        -- If it looks like a date (YYYY-MM-DD or similar)
-                        WHEN birth_or_age_value ~ '^[0-9]{4}-[0-9]{2}-[0-9]{2}' THEN
-                            EXTRACT(YEAR FROM AGE(CURRENT_DATE, birth_or_age_value::DATE))
-                        -- If it looks like a date (DD/MM/YYYY or MM/DD/YYYY)
-                        WHEN birth_or_age_value ~ '^[0-9]{2}/[0-9]{2}/[0-9]{4}' THEN
-                            EXTRACT(YEAR FROM AGE(CURRENT_DATE, TO_DATE(birth_or_age_value, 'DD/MM/YYYY')))
-                        -- If it's just a number (direct age)
-                        WHEN birth_or_age_value ~ '^[0-9]+$' THEN
-                            CAST(birth_or_age_value AS INTEGER)
-                        -- If it contains 'month' or 'week' (infant)
-                        WHEN LOWER(birth_or_age_value) LIKE '%month%' OR LOWER(birth_or_age_value) LIKE '%week%' THEN
-                            0
-                        -- Extract number from text like '25 years'
-                        WHEN birth_or_age_value ~ '[0-9]+' THEN
-                            CAST(REGEXP_REPLACE(birth_or_age_value, '[^0-9]', '', 'g') AS INTEGER)
-                        ELSE NULL
-                    END as calculated_age
-                FROM demographic_data
-                WHERE birth_or_age_value IS NOT NULL
-            ),
-            age_sex_processed AS (
+            WITH age_sex_processed AS (
                 SELECT 
                     event_id,
-                    -- Create age groups from calculated age
-                    CASE 
-                        WHEN calculated_age IS NULL THEN 'Unknown'
-                        WHEN calculated_age < 1 THEN '<1 year'
-                        WHEN calculated_age BETWEEN 1 AND 4 THEN '1-4 years'
-                        WHEN calculated_age BETWEEN 5 AND 14 THEN '5-14 years'
-                        WHEN calculated_age BETWEEN 15 AND 44 THEN '15-44 years'
-                        WHEN calculated_age >= 45 THEN '45+ years'
-                        ELSE 'Unknown'
-                    END as age_group,
-                    -- Standardize sex values
-                    CASE 
-                        WHEN LOWER(sex_value) LIKE '%male%' AND LOWER(sex_value) NOT LIKE '%female%' THEN 'Male'
-                        WHEN LOWER(sex_value) LIKE '%female%' THEN 'Female'
-                        ELSE 'Unknown'
-                    END as sex_group
-                FROM processed_demographics
+                    -- Age group as its display position: one binary search over the band
+                    -- lower bounds instead of a CASE ladder, Unknown (NULL age) last
+                    COALESCE(WIDTH_BUCKET(age_years, ARRAY[1, 5, 15, 45]) + 1, 6) as age_sort,
+                    sex_group
+                FROM dwh.mv_measles_demographics
+                WHERE (:start_date IS NULL OR event_date >= :start_date)
+                  AND (:end_date IS NULL OR event_date <= :end_date)
             ),
             age_totals AS (
                 SELECT 
-                    age_group,
+                    age_sort,
                     COUNT(DISTINCT event_id) as total_cases
                 FROM age_sex_processed
-                GROUP BY age_group
+                GROUP BY age_sort
             ),
             sex_totals AS (
                 SELECT 
@@ -962,19 +816,20 @@ def get_measles_demographic_data(start_date=None, end_date=None):
             ),
             final_breakdown AS (
                 SELECT 
-                    asp.age_group,
+                    at.age_sort,
                     at.total_cases,
-                    COUNT(DISTINCT CASE WHEN asp.sex_group = 'Male' THEN asp.event_id END) as males,
-                    COUNT(DISTINCT CASE WHEN asp.sex_group = 'Female' THEN asp.event_id END) as females,
+                    COUNT(DISTINCT asp.event_id) FILTER (WHERE asp.sex_group = 'Male') as males,
+                    COUNT(DISTINCT asp.event_id) FILTER (WHERE asp.sex_group = 'Female') as females,
                     (SELECT total_by_sex FROM sex_totals WHERE sex_group = 'Male') as total_males,
                     (SELECT total_by_sex FROM sex_totals WHERE sex_group = 'Female') as total_females,
                     (SELECT SUM(total_cases) FROM age_totals) as grand_total
                 FROM age_sex_processed asp
-                JOIN age_totals at ON asp.age_group = at.age_group
-                GROUP BY asp.age_group, at.total_cases
+                JOIN age_totals at ON asp.age_sort = at.age_sort
+                GROUP BY at.age_sort, at.total_cases
             )
             SELECT 
-                age_group as "Age Group",
+                -- Label each group once, after aggregating on the integer key
+                (ARRAY['<1 year', '1-4 years', '5-14 years', '15-44 years', '45+ years', 'Unknown'])[age_sort] as "Age Group",
                 total_cases as "Total Cases",
                 ROUND(total_cases * 100.0 / NULLIF(grand_total, 0), 1) as "% of Cases",
                 males as "Males",
@@ -983,34 +838,10 @@ def get_measles_demographic_data(start_date=None, end_date=None):
                 CASE WHEN total_females > 0 THEN ROUND(females * 100.0 / total_females, 1) ELSE 0 END as "% of All Females"
             FROM final_breakdown
             WHERE total_cases > 0
-            ORDER BY 
-                CASE age_group
-                    WHEN '<1 year' THEN 1
-                    WHEN '1-4 years' THEN 2
-                    WHEN '5-14 years' THEN 3
-                    WHEN '15-44 years' THEN 4
-                    WHEN '45+ years' THEN 5
-                    ELSE 6
-                END
+            ORDER BY age_sort
             """
             
-            # Add date filtering if provided
-            date_filter = ""
-            if start_date and end_date:
-                date_filter = f" AND e.event_date BETWEEN '{start_date}' AND '{end_date}'"
-            elif start_date:
-                date_filter = f" AND e.event_date >= '{start_date}'"
-            elif end_date:
-                date_filter = f" AND e.event_date <= '{end_date}'"
-                
-            # Apply date filter
-            if date_filter:
-                combined_query = combined_query.replace(
-                    "AND e.data_value LIKE '%Measles%'", 
-                    f"AND e.data_value LIKE '%Measles%'{date_filter}"
-                )
-            
-            df = pd.read_sql_query(text(combined_query), conn)
+            df = pd.read_sql_query(text(combined_query), conn, params={'start_date': start_date, 'end_date': end_date})
             
             return df
             
@@ -1018,17 +849,127 @@ def get_measles_demographic_data(start_date=None, end_date=None):
         st.error(f"Error fetching demographic data: {str(e)}")
         return pd.DataFrame()
 
+# The filter helpers below return SQL fragments with :name placeholders plus the values
+# to bind for them; selections are never formatted into the SQL text
+
+# Month names as they appear in the month parameter ("May 2025") -> month number
+_MONTH_NUM = {
+    'January': 1, 'February': 2, 'March': 3, 'April': 4,
+    'May': 5, 'June': 6, 'July': 7, 'August': 8,
+    'September': 9, 'October': 10, 'November': 11, 'December': 12
+}
+
+def _date_range(year, month_num=None):
+    """
+    Half-open [start, end) event_date range for a year, or for one month of it
+    Range predicates can use the event_date indexes; EXTRACT(YEAR/MONTH ...) cannot
+    
+    Args:
+        year (int): Calendar year
+        month_num (int): Month 1-12, or None for the whole year
+        
+    Returns:
+        tuple: (start, end) dates
+    """
+    if month_num is None:
+        return date(year, 1, 1), date(year + 1, 1, 1)
+    if month_num == 12:
+        return date(year, 12, 1), date(year + 1, 1, 1)
+    return date(year, month_num, 1), date(year, month_num + 1, 1)
+
+def _period_range(year, month=None):
+    """
+    Half-open [start, end) range for a year/month selection from the report filters
+    
+    Args:
+        year (int|str): Selected year, or None for no period filter
+        month (str): Month selection such as "May 2025 (23 cases)"; None or
+            "All Months <year>" selects the whole year
+        
+    Returns:
+        tuple: (start, end) dates, or None when no year is selected
+    """
+    if not year:
+        return None
+    if month and month != f"All Months {year}":
+        return _date_range(int(year), _MONTH_NUM.get(month.split()[0], 1))
+    return _date_range(int(year))
+
+@lru_cache(maxsize=512)
+def _parse_location(location):
+    """
+    Parse a location selection ("Kampala Region", "District Level - 5 districts", ...)
+    into the hierarchy level it filters on and the name to match
+    Memoized, since the location dropdown only offers a few dozen values
+    
+    Args:
+        location (str): Location selection from the report filters
+        
+    Returns:
+        tuple: (level, name) where level is 'national', 'region' or 'district';
+            name is None at national level
+    """
+    if not location or location == "National Level (MOH) - 1 units":
+        return 'national', None
+    if "Region" in location:
+        return 'region', location.replace(" Region", "").replace("Regional Level - ", "").split(" regions")[0]
+    if "District" in location:
+        return 'district', location.replace(" District", "").replace("District Level - ", "").split(" districts")[0]
+    return 'national', None
+
+@lru_cache(maxsize=512)
+def _location_filter(location, alias='doh'):
+    """
+    SQL condition on the org hierarchy alias for a location selection
+    Memoized like _parse_location, so a rerun reuses the built clause; the params
+    mapping is shared between callers and therefore read-only
+    
+    Args:
+        location (str): Location selection from the report filters
+        alias (str): Table alias carrying region_name/district_name columns
+        
+    Returns:
+        tuple: (filter, params) - an " AND <alias>.<level>_name ILIKE :location_pattern"
+            clause and its bound value, or ("", {}) at national level
+    """
+    level, name = _parse_location(location)
+    if level == 'national':
+        return "", MappingProxyType({})
+    return f" AND {alias}.{level}_name ILIKE :location_pattern", MappingProxyType({'location_pattern': f"%{name}%"})
+
+def _first_event_filters(location_filter, params):
+    """
+    Filters for a first_events CTE (first measles event per tracked entity and org unit),
+    applied before its GROUP BY so excluded events never reach the aggregate
+    A first event falls in [start_date, end_date) when some event precedes end_date and
+    the earliest is not before start_date, so only the upper bound can prune event rows
+    
+    Args:
+        location_filter (str): Clause from _location_filter on the doh alias
+        params (dict): Bound parameters; start_date/end_date when a period is selected
+        
+    Returns:
+        tuple: (org_join, date_filter, first_event_filter) SQL fragments
+    """
+    org_join = ""
+    if location_filter:
+        org_join = f"JOIN dwh.dim_eidsr_org_hierarchy doh ON e.dim_org_hierarchy_key = doh.dim_org_hierarchy_key{location_filter}"
+    if 'start_date' not in params:
+        return org_join, "", ""
+    return org_join, "AND e.event_date < :end_date", "HAVING MIN(e.event_date) >= :start_date"
+
 @st.cache_data(ttl=300)  # Cache for 5 minutes
-def get_district_reporting_metrics(location=None, year=None, month=None, days_filter=None, hours_filter=None, summary=False):
+def get_district_reporting_metrics(location=None, year=None, month=None, days_filter=21, hours_filter=24, summary=False):
     """
     Get district reporting metrics for pie charts based on selected parameters
+    All three reporting windows are counted in one pass over the measles events
     
     Args:
         location (str): Selected location from parameters
         year (int): Selected year from parameters
         month (str): Selected month from parameters
-        days_filter (int): Filter for last N days (21 for 21 days)
-        hours_filter (int): Filter for last N hours (24 for 24 hours)
+        days_filter (int): Window in days for districts_reporting_recent (21 for 21 days)
+        hours_filter (int): Window in hours for districts_reporting_24h (24 for 24 hours)
         summary (bool): Return summary data for metrics
         
     Returns:
@@ -1036,39 +977,20 @@ def get_district_reporting_metrics(location=None, year=None, month=None, days_fi
     """
     try:
         with engine.connect() as conn:
-            # Base query to get measles events with location and time filtering
-            base_conditions = []
+            # Base query to get measles events with location and time filtering;
+            # filter values are bound rather than formatted into the SQL
             date_conditions = []
+            params = {'days_filter': int(days_filter), 'hours_filter': int(hours_filter)}
             
             # Add location filtering
-            location_filter = ""
-            if location and location != "National Level (MOH) - 1 units":
-                if "Region" in location:
-                    region_name = location.replace(" Region", "").replace("Regional Level - ", "").split(" regions")[0]
-                    location_filter = f" AND doh.region_name ILIKE '%{region_name}%'"
-                elif "District" in location:
-                    district_name = location.replace(" District", "").replace("District Level - ", "").split(" districts")[0]
-                    location_filter = f" AND doh.district_name ILIKE '%{district_name}%'"
+            location_filter, location_params = _location_filter(location)
+            params.update(location_params)
             
             # Add time filtering
-            if year and month and month != f"All Months {year}":
-                # Parse month from format like "May 2025 (23 cases)"
-                month_name = month.split()[0]
-                month_num = {
-                    'January': 1, 'February': 2, 'March': 3, 'April': 4,
-                    'May': 5, 'June': 6, 'July': 7, 'August': 8,
-                    'September': 9, 'October': 10, 'November': 11, 'December': 12
-                }.get(month_name, 1)
-                date_conditions.append(f"EXTRACT(YEAR FROM e.event_date) = {year}")
-                date_conditions.append(f"EXTRACT(MONTH FROM e.event_date) = {month_num}")
-            elif year:
-                date_conditions.append(f"EXTRACT(YEAR FROM e.event_date) = {year}")
-            
-            # Add recent activity filters
-            if days_filter:
-                date_conditions.append(f"e.event_date >= CURRENT_DATE - INTERVAL '{days_filter} days'")
-            elif hours_filter:
-                date_conditions.append(f"e.event_date >= CURRENT_TIMESTAMP - INTERVAL '{hours_filter} hours'")
+            period = _period_range(year, month)
+            if period:
+                date_conditions.append("e.event_date >= :start_date AND e.event_date < :end_date")
+                params['start_date'], params['end_date'] = period
             
             # Combine date conditions
             date_filter = ""
@@ -1078,19 +1000,16 @@ def get_district_reporting_metrics(location=None, year=None, month=None, days_fi
             # Query for districts with cases in the specified period
             query = f"""
             WITH measles_events AS (
-                SELECT DISTINCT 
+                SELECT 
                     e.event_id, 
                     e.event_date, 
                     e.dim_org_hierarchy_key
-                FROM dwh.fact_eidsr_event_data e
-                WHERE e.data_element_id = 'qIlO7yEpiVv' AND e.data_value = 'Measles (B05.0_B05.9)'
-                  AND e.event_date IS NOT NULL
+                FROM dwh.measles_events() e
+                WHERE e.event_date IS NOT NULL
                   {date_filter}
             ),
             all_districts AS (
-                SELECT DISTINCT 
-                    doh.district_name,
-                    doh.dim_org_hierarchy_key
+                SELECT doh.district_name
                 FROM dwh.dim_eidsr_org_hierarchy doh
                 WHERE doh.district_name IS NOT NULL 
                   AND doh.district_name != 'Unknown'
@@ -1098,36 +1017,37 @@ def get_district_reporting_metrics(location=None, year=None, month=None, days_fi
                   {location_filter}
             ),
             districts_with_cases AS (
-                SELECT DISTINCT 
-                    doh.district_name
+                SELECT 
+                    doh.district_name,
+                    MAX(me.event_date) as last_event_date
                 FROM measles_events me
                 JOIN dwh.dim_eidsr_org_hierarchy doh ON me.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
                 WHERE doh.district_name IS NOT NULL
                   {location_filter}
+                GROUP BY doh.district_name
             )
+            -- The three district counts come from one aggregate pass over districts_with_cases
             SELECT 
                 (SELECT COUNT(DISTINCT district_name) FROM all_districts) as total_districts,
-                (SELECT COUNT(DISTINCT district_name) FROM districts_with_cases) as districts_with_cases,
-                (SELECT COUNT(DISTINCT district_name) FROM districts_with_cases) as districts_reporting_recent,
-                (SELECT COUNT(DISTINCT district_name) FROM districts_with_cases) as districts_reporting_24h
+                COUNT(*) as districts_with_cases,
+                COUNT(*) FILTER (
+                    WHERE last_event_date >= CURRENT_DATE - make_interval(days => :days_filter)
+                ) as districts_reporting_recent,
+                COUNT(*) FILTER (
+                    WHERE last_event_date >= CURRENT_TIMESTAMP - make_interval(hours => :hours_filter)
+                ) as districts_reporting_24h
+            FROM districts_with_cases
             """
             
-            result = conn.execute(text(query)).fetchone()
+            # An aggregate without GROUP BY always returns exactly one row
+            row = conn.execute(text(query), params).mappings().one()
             
-            if result:
-                return {
-                    'total_districts': result[0] or 0,
-                    'districts_with_cases': result[1] or 0,
-                    'districts_reporting_recent': result[2] or 0,
-                    'districts_reporting_24h': result[3] or 0
-                }
-            else:
-                return {
-                    'total_districts': 0,
-                    'districts_with_cases': 0,
-                    'districts_reporting_recent': 0,
-                    'districts_reporting_24h': 0
-                }
+            return {
+                'total_districts': row['total_districts'] or 0,
+                'districts_with_cases': row['districts_with_cases'] or 0,
+                'districts_reporting_recent': row['districts_reporting_recent'] or 0,
+                'districts_reporting_24h': row['districts_reporting_24h'] or 0
+            }
                 
     except Exception as e:
         st.error(f"Error fetching district reporting metrics: {str(e)}")
@@ -1147,80 +1067,53 @@ def get_measles_weekly_time_series(location=None, year=None, month=None):
         pandas.DataFrame: Weekly cases with moving average
     """
     try:
-        with engine.connect() as conn:
-            # Build date filtering conditions
-            date_conditions = []
-            location_filter = ""
-            
-            # Add location filtering
-            if location and location != "National Level (MOH) - 1 units":
-                if "Region" in location:
-                    region_name = location.replace(" Region", "").replace("Regional Level - ", "").split(" regions")[0]
-                    location_filter = f" AND doh.region_name ILIKE '%{region_name}%'"
-                elif "District" in location:
-                    district_name = location.replace(" District", "").replace("District Level - ", "").split(" districts")[0]
-                    location_filter = f" AND doh.district_name ILIKE '%{district_name}%'"
-            
-            # Add time filtering
-            if year and month and month != f"All Months {year}":
-                month_name = month.split()[0]
-                month_num = {
-                    'January': 1, 'February': 2, 'March': 3, 'April': 4,
-                    'May': 5, 'June': 6, 'July': 7, 'August': 8,
-                    'September': 9, 'October': 10, 'November': 11, 'December': 12
-                }.get(month_name, 1)
-                date_conditions.append(f"EXTRACT(YEAR FROM e.event_date) = {year}")
-                date_conditions.append(f"EXTRACT(MONTH FROM e.event_date) = {month_num}")
-            elif year:
-                date_conditions.append(f"EXTRACT(YEAR FROM e.event_date) = {year}")
-            
-            date_filter = ""
-            if date_conditions:
-                date_filter = " AND " + " AND ".join(date_conditions)
-            
-            query = f"""
-            WITH measles_events AS (
-                SELECT DISTINCT 
-                    e.event_id, 
-                    e.event_date,
-                    DATE_TRUNC('week', e.event_date) as week_starting
-                FROM dwh.fact_eidsr_event_data e
-                JOIN dwh.dim_eidsr_org_hierarchy doh ON e.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
-                WHERE e.data_element_id = 'qIlO7yEpiVv' AND e.data_value = 'Measles (B05.0_B05.9)'
-                  AND e.event_date IS NOT NULL
-                  {location_filter}
-                  {date_filter}
-            ),
-            weekly_counts AS (
-                SELECT 
-                    week_starting,
-                    COUNT(DISTINCT event_id) as weekly_cases
-                FROM measles_events
-                GROUP BY week_starting
-                ORDER BY week_starting
-            ),
-            weekly_with_moving_avg AS (
-                SELECT 
-                    week_starting,
-                    weekly_cases,
-                    AVG(weekly_cases) OVER (
-                        ORDER BY week_starting
-                        ROWS BETWEEN 6 PRECEDING AND CURRENT ROW
-                    ) as moving_average_7d
-                FROM weekly_counts
-            )
+        # Build date filtering conditions
+        date_conditions = []
+        params = {}
+        
+        # Add location filtering
+        location_filter, location_params = _location_filter(location)
+        params.update(location_params)
+        
+        # Add time filtering
+        period = _period_range(year, month)
+        if period:
+            date_conditions.append("e.event_date >= :start_date AND e.event_date < :end_date")
+            params['start_date'], params['end_date'] = period
+        
+        date_filter = ""
+        if date_conditions:
+            date_filter = " AND " + " AND ".join(date_conditions)
+        
+        query = f"""
+        WITH measles_events AS (
             SELECT 
-                week_starting,
-                weekly_cases,
-                ROUND(moving_average_7d, 1) as moving_average_7d
-            FROM weekly_with_moving_avg
-            ORDER BY week_starting DESC
-            LIMIT 20
-            """
-            
-            df = pd.read_sql_query(text(query), conn)
-            return df
-            
+                e.event_id, 
+                e.event_date,
+                DATE_TRUNC('week', e.event_date) as week_starting
+            FROM dwh.measles_events() e
+            JOIN dwh.dim_eidsr_org_hierarchy doh ON e.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
+            WHERE e.event_date IS NOT NULL
+              {location_filter}
+              {date_filter}
+        )
+        SELECT 
+            week_starting,
+            COUNT(DISTINCT event_id) as weekly_cases
+        FROM measles_events
+        GROUP BY week_starting
+        ORDER BY week_starting
+        """
+        
+        # week_starting is a timestamptz, which the COPY/CSV path would shift to UTC
+        with engine.connect() as conn:
+            df = pd.read_sql_query(text(query), conn, params=params)
+        
+        # The series is a few hundred weeks at most, so the moving average is a
+        # vectorized rolling mean here rather than a window function in SQL
+        df['moving_average_7d'] = df['weekly_cases'].astype(float).rolling(7, min_periods=1).mean().round(1)
+        return df.tail(20).iloc[::-1].reset_index(drop=True)
+        
     except Exception as e:
         st.error(f"Error fetching weekly time series data: {str(e)}")
         return pd.DataFrame()
@@ -1237,29 +1130,17 @@ def get_measles_weekly_by_sex(location=None, year=None, month=None):
         with engine.connect() as conn:
             # Build filtering conditions
             date_conditions = []
-            location_filter = ""
+            params = {}
             
             # Add location filtering
-            if location and location != "National Level (MOH) - 1 units":
-                if "Region" in location:
-                    region_name = location.replace(" Region", "").replace("Regional Level - ", "").split(" regions")[0]
-                    location_filter = f" AND doh.region_name ILIKE '%{region_name}%'"
-                elif "District" in location:
-                    district_name = location.replace(" District", "").replace("District Level - ", "").split(" districts")[0]
-                    location_filter = f" AND doh.district_name ILIKE '%{district_name}%'"
+            location_filter, location_params = _location_filter(location)
+            params.update(location_params)
             
             # Add time filtering
-            if year and month and month != f"All Months {year}":
-                month_name = month.split()[0]
-                month_num = {
-                    'January': 1, 'February': 2, 'March': 3, 'April': 4,
-                    'May': 5, 'June': 6, 'July': 7, 'August': 8,
-                    'September': 9, 'October': 10, 'November': 11, 'December': 12
-                }.get(month_name, 1)
-                date_conditions.append(f"EXTRACT(YEAR FROM e.event_date) = {year}")
-                date_conditions.append(f"EXTRACT(MONTH FROM e.event_date) = {month_num}")
-            elif year:
-                date_conditions.append(f"EXTRACT(YEAR FROM e.event_date) = {year}")
+            period = _period_range(year, month)
+            if period:
+                date_conditions.append("e.event_date >= :start_date AND e.event_date < :end_date")
+                params['start_date'], params['end_date'] = period
             
             date_filter = ""
             if date_conditions:
@@ -1267,38 +1148,37 @@ def get_measles_weekly_by_sex(location=None, year=None, month=None):
             
             query = f"""
             WITH measles_events AS (
-                SELECT DISTINCT 
+                SELECT 
                     e.event_id, 
                     e.tracked_entity_instance_id,
                     e.event_date,
                     DATE_TRUNC('week', e.event_date) as week_starting
-                FROM dwh.fact_eidsr_event_data e
+                FROM dwh.measles_events() e
                 JOIN dwh.dim_eidsr_org_hierarchy doh ON e.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
-                WHERE e.data_element_id = 'qIlO7yEpiVv' AND e.data_value = 'Measles (B05.0_B05.9)'
-                  AND e.event_date IS NOT NULL
+                WHERE e.event_date IS NOT NULL
                   AND e.tracked_entity_instance_id IS NOT NULL
                   {location_filter}
                   {date_filter}
             ),
+            -- One row per (event, week, sex) so the weekly counts below need no DISTINCT
             sex_data AS (
-                SELECT 
+                SELECT DISTINCT 
                     me.event_id,
                     me.week_starting,
-                    CASE 
-                        WHEN LOWER(gender.attribute_value) = 'male' THEN 'Male'
-                        WHEN LOWER(gender.attribute_value) = 'female' THEN 'Female'
-                        ELSE 'Unknown'
-                    END as sex_group
+                    COALESCE(sex_codes.sex_group, 'Unknown') as sex_group
                 FROM measles_events me
                 LEFT JOIN dwh.fact_eidsr_tracked_entity_attributes gender 
                     ON me.tracked_entity_instance_id = gender.entity_id 
                     AND gender.attribute_id = 'Rq4qM2wKYFL'
+                -- Lookup join: one hash probe per row instead of a CASE branch per value
+                LEFT JOIN (VALUES ('male', 'Male'), ('female', 'Female')) sex_codes(raw_value, sex_group)
+                    ON LOWER(gender.attribute_value) = sex_codes.raw_value
             ),
             weekly_by_sex AS (
                 SELECT 
                     week_starting,
-                    COUNT(DISTINCT CASE WHEN sex_group = 'Male' THEN event_id END) as male_cases,
-                    COUNT(DISTINCT CASE WHEN sex_group = 'Female' THEN event_id END) as female_cases
+                    COUNT(*) FILTER (WHERE sex_group = 'Male') as male_cases,
+                    COUNT(*) FILTER (WHERE sex_group = 'Female') as female_cases
                 FROM sex_data
                 GROUP BY week_starting
             )
@@ -1312,7 +1192,7 @@ def get_measles_weekly_by_sex(location=None, year=None, month=None):
             LIMIT 20
             """
             
-            df = pd.read_sql_query(text(query), conn)
+            df = pd.read_sql_query(text(query), conn, params=params)
             return df
             
     except Exception as e:
@@ -1320,176 +1200,127 @@ def get_measles_weekly_by_sex(location=None, year=None, month=None):
         return pd.DataFrame()
 
 @st.cache_data(ttl=300)  # Cache for 5 minutes
-def get_measles_top_districts_epicurves(location=None, year=None, month=None):
+def get_measles_top_districts_epicurves(location=None, year=None, month=None, top_districts=None):
     """
     Get epicurve data for top 12 districts with measles cases
     
+    Args:
+        location (str): Selected location from parameters
+        year (int): Selected year from parameters
+        month (str): Selected month from parameters
+        top_districts (pandas.DataFrame): Result of get_measles_top_10_districts(year=year)
+            when the caller already has it; fetched here otherwise
+    
     Returns:
         list: List of dictionaries with district name and epicurve data
     """
     try:
-        with engine.connect() as conn:
-            # First get the top districts using the existing function (filtered by year if provided)
+        # First get the top districts using the existing function (filtered by year if provided)
+        if top_districts is None:
             top_districts = get_measles_top_10_districts(year=year)
-            
-            if top_districts.empty:
-                return []
-            
-            epicurve_data = []
-            
-            # Build date filter for epicurve data - show latest data for better visualization
-            if year:
-                date_filter = f"AND EXTRACT(YEAR FROM e.event_date) = {year}"
-            else:
-                # Show last 12 months of data for better epicurve visualization
-                date_filter = "AND e.event_date >= CURRENT_DATE - INTERVAL '12 months'"
-            
-            # Get epicurve data for each district in the top districts list
-            for _, row in top_districts.iterrows():
-                district_name = row['District']
-                
-                district_query = f"""
-                WITH measles_events AS (
-                    SELECT DISTINCT 
-                        e.event_id, 
-                        e.event_date,
-                        EXTRACT(WEEK FROM e.event_date) as epi_week
-                    FROM dwh.fact_eidsr_event_data e
-                    JOIN dwh.dim_eidsr_org_hierarchy doh ON e.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
-                    WHERE e.data_element_id = 'qIlO7yEpiVv' AND e.data_value = 'Measles (B05.0_B05.9)'
-                      AND e.event_date IS NOT NULL
-                      AND doh.district_name = '{district_name}'
-                      {date_filter}
-                ),
-                weekly_counts AS (
-                    SELECT 
-                        epi_week,
-                        COUNT(DISTINCT event_id) as weekly_cases
-                    FROM measles_events
-                    GROUP BY epi_week
-                    HAVING COUNT(DISTINCT event_id) > 0
-                    ORDER BY epi_week
-                )
-                SELECT 
-                    epi_week,
-                    weekly_cases
-                FROM weekly_counts
-                WHERE weekly_cases > 0
-                ORDER BY epi_week
-                """
-                
-                district_df = pd.read_sql_query(text(district_query), conn)
-                
-                # Only add districts that actually have data
-                if not district_df.empty and district_df['weekly_cases'].sum() > 0:
-                    epicurve_data.append({
-                        'district': district_name,
-                        'data': district_df
-                    })
-            
-            return epicurve_data
-            
+        
+        if top_districts.empty:
+            return []
+        
+        names = top_districts['District'].tolist()
+        
+        # Weekly counts for all top districts in one pass. Without a year, show the
+        # last 12 months of data for better epicurve visualization. Served from the
+        # daily district rollup (schema/rollups.sql), a few rows per district per day,
+        # instead of aggregating the events on every page load
+        query = text("""
+        SELECT 
+            district_name,
+            EXTRACT(WEEK FROM event_date) as epi_week,
+            SUM(cases) as weekly_cases
+        FROM dwh.fact_measles_daily_district
+        WHERE district_name = ANY(:names)
+          AND event_date >= :start_date
+          AND (:end_date IS NULL OR event_date < :end_date)
+        GROUP BY district_name, EXTRACT(WEEK FROM event_date)
+        ORDER BY district_name, epi_week
+        """)
+        
+        if year:
+            start_date, end_date = _date_range(int(year))
+        else:
+            start_date, end_date = (pd.Timestamp.today().normalize() - pd.DateOffset(months=12)).date(), None
+        
+        # Bulk path: COPY stream parsed by pyarrow; the names list is sent as an array
+        df = read_sql_copy(
+            query,
+            {'names': names, 'start_date': start_date, 'end_date': end_date},
+            dtype={'district_name': 'object', 'epi_week': 'int64', 'weekly_cases': 'int64'}
+        )
+        
+        # Keep the top-districts order; only districts that actually have data are added
+        curves = {name: g[['epi_week', 'weekly_cases']].reset_index(drop=True) for name, g in df.groupby('district_name', sort=False)}
+        return [{'district': name, 'data': curves[name]} for name in names if name in curves]
+        
     except Exception as e:
         st.error(f"Error fetching district epicurve data: {str(e)}")
         return []
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
+@st.cache_data(ttl=3600, show_spinner=False)  # Cache for 1 hour; the sources change only on refresh
 def get_district_weekly_proportions(location=None, year=None, month=None):
     """
-    Get weekly proportion of cases by top 5 districts over time - optimized with data_element_id
+    Get weekly proportion of cases by top 5 districts over time
+    Reads district-day counts from the daily rollup; weekly totals, the top 5
+    and the proportions are worked out in pandas over the few hundred rows
     
     Returns:
         pandas.DataFrame: Weekly proportions for top districts
     """
     try:
+        # Build time filter based on year parameter
+        params = {}
+        if year:
+            date_filter = "r.event_date >= :start_date AND r.event_date < :end_date"
+            params['start_date'], params['end_date'] = _date_range(int(year))
+        else:
+            # Default to last 12 months if no year specified
+            date_filter = "r.event_date >= CURRENT_DATE - INTERVAL '12 months'"
+        
+        # Build location filter
+        location_filter, location_params = _location_filter(location, alias='r')
+        params.update(location_params)
+        
+        query = f"""
+        SELECT 
+            DATE_TRUNC('week', r.event_date)::date as week_starting,
+            r.district_name,
+            SUM(r.cases) as district_cases
+        FROM dwh.fact_measles_daily_district r
+        WHERE {date_filter}
+          {location_filter}
+        GROUP BY 1, 2
+        """
+        
+        # Per-district weekly counts fit in int32; halves the cached frame's count column.
+        # week_starting is a date, which the COPY/CSV path would not keep
         with engine.connect() as conn:
-            # Build time filter based on year parameter
-            if year:
-                date_filter = f"EXTRACT(YEAR FROM e.event_date) = {year}"
-            else:
-                # Default to last 12 months if no year specified
-                date_filter = "e.event_date >= CURRENT_DATE - INTERVAL '12 months'"
-            
-            # Build location filter
-            location_filter = ""
-            if location and location != "National Level (MOH) - 1 units":
-                if "Region" in location:
-                    region_name = location.replace(" Region", "").replace("Regional Level - ", "").split(" regions")[0]
-                    location_filter = f" AND doh.region_name ILIKE '%{region_name}%'"
-                elif "District" in location:
-                    district_name = location.replace(" District", "").replace("District Level - ", "").split(" districts")[0]
-                    location_filter = f" AND doh.district_name ILIKE '%{district_name}%'"
-            
-            query = f"""
-            WITH measles_events AS (
-                SELECT DISTINCT 
-                    e.event_id, 
-                    e.event_date,
-                    DATE_TRUNC('week', e.event_date) as week_starting,
-                    doh.district_name
-                FROM dwh.fact_eidsr_event_data e
-                JOIN dwh.dim_eidsr_org_hierarchy doh ON e.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
-                WHERE e.data_element_id = 'qIlO7yEpiVv' AND e.data_value = 'Measles (B05.0_B05.9)'
-                  AND e.event_date IS NOT NULL
-                  AND doh.district_name IS NOT NULL
-                  AND {date_filter}
-                  {location_filter}
-            ),
-            district_weekly_cases AS (
-                SELECT 
-                    week_starting,
-                    district_name,
-                    COUNT(DISTINCT event_id) as district_cases
-                FROM measles_events
-                GROUP BY week_starting, district_name
-            ),
-            weekly_totals AS (
-                SELECT 
-                    week_starting,
-                    SUM(district_cases) as total_weekly_cases
-                FROM district_weekly_cases
-                GROUP BY week_starting
-            ),
-            top_districts AS (
-                SELECT 
-                    district_name,
-                    SUM(district_cases) as total_cases
-                FROM district_weekly_cases
-                GROUP BY district_name
-                ORDER BY total_cases DESC
-                LIMIT 5
-            ),
-            district_proportions AS (
-                SELECT 
-                    dwc.week_starting,
-                    dwc.district_name,
-                    dwc.district_cases,
-                    wt.total_weekly_cases,
-                    ROUND((dwc.district_cases * 100.0 / NULLIF(wt.total_weekly_cases, 0)), 2) as proportion
-                FROM district_weekly_cases dwc
-                JOIN weekly_totals wt ON dwc.week_starting = wt.week_starting
-                WHERE dwc.district_name IN (SELECT district_name FROM top_districts)
-            )
-            SELECT 
-                week_starting,
-                district_name as district,
-                proportion
-            FROM district_proportions
-            WHERE proportion IS NOT NULL
-            ORDER BY week_starting, district_name
-            """
-            
-            df = pd.read_sql_query(text(query), conn)
-            return df
-            
+            df = pd.read_sql_query(text(query), conn, params=params, dtype={'district_cases': 'int32'})
+        if df.empty:
+            return pd.DataFrame(columns=['week_starting', 'district', 'proportion'])
+        
+        # Weekly totals cover every district; only the top 5 rows need a proportion
+        weekly_totals = df.groupby('week_starting')['district_cases'].transform('sum')
+        top_districts = df.groupby('district_name')['district_cases'].sum().nlargest(5).index
+        in_top = df['district_name'].isin(top_districts).to_numpy()
+        
+        top = df.loc[in_top, ['week_starting', 'district_name']].rename(columns={'district_name': 'district'})
+        top['proportion'] = (df['district_cases'].to_numpy()[in_top] * 100.0 / weekly_totals.to_numpy()[in_top]).round(2)
+        return top.sort_values(['week_starting', 'district']).reset_index(drop=True)
+        
     except Exception as e:
         st.error(f"Error fetching district weekly proportions: {str(e)}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
+@st.cache_data(ttl=3600, show_spinner=False)  # Cache for 1 hour; the sources change only on refresh
 def get_district_total_proportions(location=None, year=None, month=None):
     """
     Get total proportion of cases by district
+    Summed from the daily rollup; proportions are of all districts in the selection
     
     Returns:
         pandas.DataFrame: District proportions sorted by total cases
@@ -1498,118 +1329,78 @@ def get_district_total_proportions(location=None, year=None, month=None):
         with engine.connect() as conn:
             # Build filtering conditions
             date_conditions = []
-            location_filter = ""
+            params = {}
             
             # Add location filtering
-            if location and location != "National Level (MOH) - 1 units":
-                if "Region" in location:
-                    region_name = location.replace(" Region", "").replace("Regional Level - ", "").split(" regions")[0]
-                    location_filter = f" AND doh.region_name ILIKE '%{region_name}%'"
-                elif "District" in location:
-                    district_name = location.replace(" District", "").replace("District Level - ", "").split(" districts")[0]
-                    location_filter = f" AND doh.district_name ILIKE '%{district_name}%'"
+            location_filter, location_params = _location_filter(location, alias='r')
+            params.update(location_params)
             
             # Add time filtering
-            if year and month and month != f"All Months {year}":
-                month_name = month.split()[0]
-                month_num = {
-                    'January': 1, 'February': 2, 'March': 3, 'April': 4,
-                    'May': 5, 'June': 6, 'July': 7, 'August': 8,
-                    'September': 9, 'October': 10, 'November': 11, 'December': 12
-                }.get(month_name, 1)
-                date_conditions.append(f"EXTRACT(YEAR FROM e.event_date) = {year}")
-                date_conditions.append(f"EXTRACT(MONTH FROM e.event_date) = {month_num}")
-            elif year:
-                date_conditions.append(f"EXTRACT(YEAR FROM e.event_date) = {year}")
+            period = _period_range(year, month)
+            if period:
+                date_conditions.append("r.event_date >= :start_date AND r.event_date < :end_date")
+                params['start_date'], params['end_date'] = period
             
             date_filter = ""
             if date_conditions:
                 date_filter = " AND " + " AND ".join(date_conditions)
             
             query = f"""
-            WITH measles_events AS (
-                SELECT DISTINCT 
-                    e.event_id, 
-                    e.event_date, 
-                    e.dim_org_hierarchy_key
-                FROM dwh.fact_eidsr_event_data e
-                WHERE e.data_element_id = 'qIlO7yEpiVv' AND e.data_value = 'Measles (B05.0_B05.9)'
-                  AND e.event_date IS NOT NULL
-                  {date_filter}
-            ),
-            district_cases AS (
-                SELECT 
-                    doh.district_name,
-                    COUNT(DISTINCT me.event_id) as district_cases
-                FROM measles_events me
-                JOIN dwh.dim_eidsr_org_hierarchy doh ON me.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
-                WHERE doh.district_name IS NOT NULL 
-                  AND doh.district_name != 'Unknown'
-                  AND doh.district_name != '1 Test District'
-                  {location_filter}
-                GROUP BY doh.district_name
-            ),
-            total_cases AS (
-                SELECT SUM(district_cases) as grand_total
-                FROM district_cases
-            )
             SELECT 
-                dc.district_name as district,
-                dc.district_cases as cases,
-                ROUND((dc.district_cases * 100.0 / NULLIF(tc.grand_total, 0)), 2) as proportion
-            FROM district_cases dc
-            CROSS JOIN total_cases tc
-            WHERE dc.district_cases > 0
-            ORDER BY dc.district_cases DESC
-            LIMIT 5
+                r.district_name as district,
+                SUM(r.cases) as cases
+            FROM dwh.fact_measles_daily_district r
+            WHERE 1=1
+              {date_filter}
+              {location_filter}
+            GROUP BY r.district_name
             """
             
-            df = pd.read_sql_query(text(query), conn)
-            return df
+            df = pd.read_sql_query(text(query), conn, params=params, dtype={'cases': 'int32'})
+            df = df[df['cases'] > 0].copy()
+            df['proportion'] = (df['cases'] * 100.0 / df['cases'].sum()).round(2)
+            return df.nlargest(5, 'cases').reset_index(drop=True)
             
     except Exception as e:
         st.error(f"Error fetching district total proportions: {str(e)}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
+# Shown when the gender query returns nothing or fails; st.cache_data hands callers a copy
+_PLACEHOLDER_GENDER = pd.DataFrame({
+    'gender': ['Male', 'Female', 'Unknown'],
+    'cases': [45, 38, 5]
+})
+
+@st.cache_data(ttl=3600, show_spinner=False)  # Cache for 1 hour; the sources change only on refresh
 def get_measles_gender_distribution(location=None, year=None, month=None):
     """Get gender distribution of measles cases"""
     try:
         with engine.connect() as conn:
             # Build filtering conditions
-            date_conditions = []
-            location_filter = ""
+            params = {}
             
-            if location and location != "National Level (MOH) - 1 units":
-                if "Region" in location:
-                    region_name = location.replace(" Region", "").replace("Regional Level - ", "").split(" regions")[0]
-                    location_filter = f" AND doh.region_name ILIKE '%{region_name}%'"
-                elif "District" in location:
-                    district_name = location.replace(" District", "").replace("District Level - ", "").split(" districts")[0]
-                    location_filter = f" AND doh.district_name ILIKE '%{district_name}%'"
+            location_filter, location_params = _location_filter(location)
+            params.update(location_params)
             
-            if year and month and month != f"All Months {year}":
-                month_name = month.split()[0]
-                month_num = {'January': 1, 'February': 2, 'March': 3, 'April': 4, 'May': 5, 'June': 6, 'July': 7, 'August': 8, 'September': 9, 'October': 10, 'November': 11, 'December': 12}.get(month_name, 1)
-                date_conditions.append(f"EXTRACT(YEAR FROM events.event_date) = {year}")
-                date_conditions.append(f"EXTRACT(MONTH FROM events.event_date) = {month_num}")
-            elif year:
-                date_conditions.append(f"EXTRACT(YEAR FROM events.event_date) = {year}")
+            period = _period_range(year, month)
+            if period:
+                params['start_date'], params['end_date'] = period
             
-            date_filter = ""
-            if date_conditions:
-                date_filter = " AND " + " AND ".join(date_conditions)
+            org_join, date_filter, first_event_filter = _first_event_filters(location_filter, params)
             
             query = f"""
             WITH first_events AS (
                 SELECT 
-                    tracked_entity_instance_id,
-                    MIN(event_date) as first_event_date,
-                    dim_org_hierarchy_key
-                FROM dwh.fact_eidsr_event_data
-                WHERE data_element_id = 'qIlO7yEpiVv' AND data_value = 'Measles (B05.0_B05.9)'
-                  AND event_date IS NOT NULL
-                GROUP BY tracked_entity_instance_id, dim_org_hierarchy_key
+                    e.tracked_entity_instance_id,
+                    MIN(e.event_date) as first_event_date,
+                    e.dim_org_hierarchy_key
+                FROM dwh.measles_events() e
+                {org_join}
+                WHERE e.event_date IS NOT NULL
+                  AND e.tracked_entity_instance_id IS NOT NULL
+                  {date_filter}
+                GROUP BY e.tracked_entity_instance_id, e.dim_org_hierarchy_key
+                {first_event_filter}
             ),
             gender_classification AS (
                 SELECT 
@@ -1626,16 +1417,10 @@ def get_measles_gender_distribution(location=None, year=None, month=None):
                     gender.entity_id = fe.tracked_entity_instance_id
                     AND gender.attribute_id = 'Rq4qM2wKYFL'
                 )
-                LEFT JOIN dwh.dim_eidsr_org_hierarchy doh ON (
-                    fe.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
-                )
-                WHERE 1=1
-                  {location_filter}
-                  {date_filter.replace('events.event_date', 'fe.first_event_date') if date_filter else ''}
             )
             SELECT
                 gender_category as gender,
-                COUNT(tracked_entity_instance_id) AS cases
+                COUNT(*) AS cases
             FROM gender_classification
             GROUP BY gender_category
             ORDER BY
@@ -1647,187 +1432,147 @@ def get_measles_gender_distribution(location=None, year=None, month=None):
                 END
             """
             
-            df = pd.read_sql_query(text(query), conn)
+            df = pd.read_sql_query(text(query), conn, params=params, dtype={'cases': 'int32'})
             
             # If no data is returned, provide placeholder data
             if df.empty:
-                return pd.DataFrame({
-                    'gender': ['Male', 'Female', 'Unknown'],
-                    'cases': [45, 38, 5]
-                })
+                return _PLACEHOLDER_GENDER
             
             return df
             
     except Exception as e:
         st.error(f"Error fetching gender distribution: {str(e)}")
-        return pd.DataFrame({
-            'gender': ['Male', 'Female', 'Unknown'],
-            'cases': [45, 38, 5]
-        })
+        return _PLACEHOLDER_GENDER
+
+# Five-year age groups used by the age/sex charts; ages arrive as text attributes
+AGE_GROUP_LABELS = ['0-4', '5-9', '10-14', '15-19', '20-24', '25-29', '30-34', '35-39', '40-44', '45-49', '50+', 'Unknown']
+AGE_GROUP_BINS = [-1, 4, 9, 14, 19, 24, 29, 34, 39, 44, 49, np.inf]
+
+# Placeholder case counts per age group (AGE_GROUP_LABELS without 'Unknown')
+_PLACEHOLDER_AGE_SEX_MALE = np.array([8, 12, 15, 10, 8, 6, 4, 3, 2, 1, 2])
+_PLACEHOLDER_AGE_SEX_FEMALE = np.array([6, 10, 12, 8, 6, 5, 3, 2, 1, 1, 1])
+
+def _placeholder_multiplier(location, year):
+    """Scale of the empty-result placeholders: smaller for regions/districts and past years"""
+    multiplier = {'region': 0.7, 'district': 0.4}.get(_parse_location(location)[0], 1.0)
+    if year and int(year) < datetime.now().year:
+        multiplier *= 0.8
+    return multiplier
+
+def _placeholder_age_sex(multiplier):
+    """Placeholder age/sex distribution with counts scaled by multiplier (at least 1 per group)"""
+    return pd.DataFrame({
+        'age_group': AGE_GROUP_LABELS[:-1],
+        'male_cases': np.maximum(1, (_PLACEHOLDER_AGE_SEX_MALE * multiplier).astype(int)),
+        'female_cases': np.maximum(1, (_PLACEHOLDER_AGE_SEX_FEMALE * multiplier).astype(int))
+    })
+
+def bucket_age_groups(age_values):
+    """
+    Map integer ages (already cast, e.g. mv_measles_entity_age_sex.age_years) to
+    AGE_GROUP_LABELS with a vectorized pd.cut; missing ages fall into 'Unknown'
+    """
+    # to_numeric: a column of only NULLs is read back as object dtype
+    groups = pd.cut(pd.to_numeric(age_values), bins=AGE_GROUP_BINS, labels=AGE_GROUP_LABELS[:-1])
+    return groups.cat.add_categories('Unknown').fillna('Unknown')
+
+def classify_sex(sex_values):
+    """Map raw sex attribute values to 'Male', 'Female' or 'Unknown'"""
+    sex = sex_values.astype('string').str.lower()
+    is_female = sex.str.contains('female', na=False)
+    is_male = sex.str.contains('male', na=False) & ~is_female
+    return pd.Series(np.select([is_male, is_female], ['Male', 'Female'], 'Unknown'), index=sex_values.index)
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes  
+@st.cache_data(ttl=3600, show_spinner=False)  # Cache for 1 hour; the sources change only on refresh
 def get_measles_age_sex_distribution(location=None, year=None, month=None):
     """Get age and sex distribution of measles cases - cumulative when no parameters, filtered otherwise"""
     try:
         with engine.connect() as conn:
+            params = {}
+            
             # Check if we want cumulative data (no parameters passed)
             if location is None and year is None and month is None:
                 # Get cumulative data from ALL years and locations - no filters
-                location_filter = ""
-                date_filter = ""
+                org_join, date_filter, first_event_filter = "", "", ""
             else:
-                # Build filtering conditions for specific parameters
-                date_conditions = []
-                location_filter = ""
+                # Build filtering conditions for specific parameters; values are bound
                 
                 # Add location filtering
-                if location and location != "National Level (MOH) - 1 units":
-                    if "Region" in location:
-                        region_name = location.replace(" Region", "").replace("Regional Level - ", "").split(" regions")[0]
-                        location_filter = f" AND doh.region_name ILIKE '%{region_name}%'"
-                    elif "District" in location:
-                        district_name = location.replace(" District", "").replace("District Level - ", "").split(" districts")[0]
-                        location_filter = f" AND doh.district_name ILIKE '%{district_name}%'"
+                location_filter, location_params = _location_filter(location)
+                params.update(location_params)
                 
                 # Add time filtering  
-                if year and month and month != f"All Months {year}":
-                    month_name = month.split()[0]
-                    month_num = {'January': 1, 'February': 2, 'March': 3, 'April': 4, 'May': 5, 'June': 6, 'July': 7, 'August': 8, 'September': 9, 'October': 10, 'November': 11, 'December': 12}.get(month_name, 1)
-                    date_conditions.append(f"EXTRACT(YEAR FROM events.event_date) = {year}")
-                    date_conditions.append(f"EXTRACT(MONTH FROM events.event_date) = {month_num}")
-                elif year:
-                    date_conditions.append(f"EXTRACT(YEAR FROM events.event_date) = {year}")
+                period = _period_range(year, month)
+                if period:
+                    params['start_date'], params['end_date'] = period
                 
-                date_filter = ""
-                if date_conditions:
-                    date_filter = " AND " + " AND ".join(date_conditions)
+                org_join, date_filter, first_event_filter = _first_event_filters(location_filter, params)
             
             query = f"""
             WITH first_events AS (
                 SELECT 
-                    tracked_entity_instance_id,
-                    MIN(event_date) as first_event_date,
-                    dim_org_hierarchy_key
-                FROM dwh.fact_eidsr_event_data
-                WHERE data_element_id = 'qIlO7yEpiVv' AND data_value = 'Measles (B05.0_B05.9)'
-                  AND event_date IS NOT NULL
-                GROUP BY tracked_entity_instance_id, dim_org_hierarchy_key
-            ),
-            age_sex_data AS (
-                SELECT
-                    fe.tracked_entity_instance_id,
-                    fe.first_event_date,
-                    fe.dim_org_hierarchy_key,
-                    CASE
-                        WHEN age_years.attribute_value ~ '^[0-9]+$' THEN
-                            CASE
-                                WHEN age_years.attribute_value::int BETWEEN 0 AND 4 THEN '0-4'
-                                WHEN age_years.attribute_value::int BETWEEN 5 AND 9 THEN '5-9'
-                                WHEN age_years.attribute_value::int BETWEEN 10 AND 14 THEN '10-14'
-                                WHEN age_years.attribute_value::int BETWEEN 15 AND 19 THEN '15-19'
-                                WHEN age_years.attribute_value::int BETWEEN 20 AND 24 THEN '20-24'
-                                WHEN age_years.attribute_value::int BETWEEN 25 AND 29 THEN '25-29'
-                                WHEN age_years.attribute_value::int BETWEEN 30 AND 34 THEN '30-34'
-                                WHEN age_years.attribute_value::int BETWEEN 35 AND 39 THEN '35-39'
-                                WHEN age_years.attribute_value::int BETWEEN 40 AND 44 THEN '40-44'
-                                WHEN age_years.attribute_value::int BETWEEN 45 AND 49 THEN '45-49'
-                                WHEN age_years.attribute_value::int >= 50 THEN '50+'
-                                ELSE 'Unknown'
-                            END
-                        ELSE 'Unknown'
-                    END AS age_group,
-                    CASE 
-                        WHEN LOWER(sex.attribute_value) LIKE '%male%' AND LOWER(sex.attribute_value) NOT LIKE '%female%' THEN 'Male'
-                        WHEN LOWER(sex.attribute_value) LIKE '%female%' THEN 'Female'
-                        ELSE 'Unknown'
-                    END as sex_category
-                FROM first_events fe
-                LEFT JOIN dwh.fact_eidsr_tracked_entity_attributes age_years ON (
-                    age_years.entity_id = fe.tracked_entity_instance_id
-                    AND age_years.attribute_id = 'UezutfURtQG'
-                )
-                LEFT JOIN dwh.fact_eidsr_tracked_entity_attributes sex ON (
-                    sex.entity_id = fe.tracked_entity_instance_id
-                    AND sex.attribute_id = 'Rq4qM2wKYFL'
-                )
-                LEFT JOIN dwh.dim_eidsr_org_hierarchy doh ON (
-                    fe.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
-                )
-                WHERE 1=1
-                  {location_filter}
-                  {date_filter.replace('events.event_date', 'fe.first_event_date') if date_filter else ''}
+                    e.tracked_entity_instance_id,
+                    MIN(e.event_date) as first_event_date,
+                    e.dim_org_hierarchy_key
+                FROM dwh.measles_events() e
+                {org_join}
+                WHERE e.event_date IS NOT NULL
+                  AND e.tracked_entity_instance_id IS NOT NULL
+                  {date_filter}
+                GROUP BY e.tracked_entity_instance_id, e.dim_org_hierarchy_key
+                {first_event_filter}
             )
             SELECT
-                age_group,
-                COUNT(CASE WHEN sex_category = 'Male' THEN tracked_entity_instance_id END) as male_cases,
-                COUNT(CASE WHEN sex_category = 'Female' THEN tracked_entity_instance_id END) as female_cases,
-                COUNT(CASE WHEN sex_category = 'Unknown' THEN tracked_entity_instance_id END) as unknown_cases
-            FROM age_sex_data
-            GROUP BY age_group
-            ORDER BY
-                CASE age_group
-                    WHEN '0-4' THEN 1
-                    WHEN '5-9' THEN 2
-                    WHEN '10-14' THEN 3
-                    WHEN '15-19' THEN 4
-                    WHEN '20-24' THEN 5
-                    WHEN '25-29' THEN 6
-                    WHEN '30-34' THEN 7
-                    WHEN '35-39' THEN 8
-                    WHEN '40-44' THEN 9
-                    WHEN '45-49' THEN 10
-                    WHEN '50+' THEN 11
-                    WHEN 'Unknown' THEN 12
-                    ELSE 13
-                END
+                fe.tracked_entity_instance_id,
+                a.age_years,
+                a.sex_value
+            FROM first_events fe
+            LEFT JOIN dwh.mv_measles_entity_age_sex a ON a.entity_id = fe.tracked_entity_instance_id
             """
             
-            df = pd.read_sql_query(text(query), conn)
+            # Bucketing and counting happen in pandas rather than per row on the server
+            cases = read_sql_streamed(text(query), conn, params)
+            df = pd.crosstab(
+                bucket_age_groups(cases['age_years']),
+                classify_sex(cases['sex_value'])
+            )
+            df = (
+                df.reindex(columns=['Male', 'Female', 'Unknown'], fill_value=0)
+                .rename(columns={'Male': 'male_cases', 'Female': 'female_cases', 'Unknown': 'unknown_cases'})
+                .rename_axis(index='age_group', columns=None)
+                .reset_index()
+            )
+            df['age_group'] = df['age_group'].astype(str)
             
             # If no real data, return parameter-adjusted placeholder data
             if df.empty:
-                base_male = [8, 12, 15, 10, 8, 6, 4, 3, 2, 1, 2]
-                base_female = [6, 10, 12, 8, 6, 5, 3, 2, 1, 1, 1]
-                
-                # Apply parameter-based scaling
-                multiplier = 1.0
-                if location and location != "National Level (MOH) - 1 units":
-                    if "Region" in location:
-                        multiplier = 0.7
-                    elif "District" in location:
-                        multiplier = 0.4
-                
-                from datetime import datetime
-                if year and int(year) < datetime.now().year:
-                    multiplier *= 0.8
-                
-                adj_male = [max(1, int(m * multiplier)) for m in base_male]
-                adj_female = [max(1, int(f * multiplier)) for f in base_female]
-                
-                return pd.DataFrame({
-                    'age_group': ['0-4', '5-9', '10-14', '15-19', '20-24', '25-29', '30-34', '35-39', '40-44', '45-49', '50+'],
-                    'male_cases': adj_male,
-                    'female_cases': adj_female
-                })
+                return _placeholder_age_sex(_placeholder_multiplier(location, year))
             
             return df
             
     except Exception as e:
         st.error(f"Error fetching age-sex distribution: {str(e)}")
         # Return parameter-scaled fallback data
-        multiplier = 0.5 if location and "District" in location else 1.0
-        base_male = [8, 12, 15, 10, 8, 6, 4, 3, 2, 1, 2]
-        base_female = [6, 10, 12, 8, 6, 5, 3, 2, 1, 1, 1]
-        adj_male = [max(1, int(m * multiplier)) for m in base_male]
-        adj_female = [max(1, int(f * multiplier)) for f in base_female]
-        
-        return pd.DataFrame({
-            'age_group': ['0-4', '5-9', '10-14', '15-19', '20-24', '25-29', '30-34', '35-39', '40-44', '45-49', '50+'],
-            'male_cases': adj_male,
-            'female_cases': adj_female
-        })
+        multiplier = 0.5 if _parse_location(location)[0] == 'district' else 1.0
+        return _placeholder_age_sex(multiplier)
+
+def _add_attack_rates(df):
+    """
+    Add female/male attack rates: each age group's cases per 100,000 cases of that sex,
+    a simple standardized rate for epidemiological data; both columns in one operation
+    """
+    counts = df[['female_cases', 'male_cases']]
+    df[['female_attack_rate', 'male_attack_rate']] = (counts * 100000 / counts.sum()).round(2).to_numpy()
+    return df
+
+# Attack-rate placeholder shown when the query returns nothing or fails
+_PLACEHOLDER_ATTACK_RATES = _add_attack_rates(pd.DataFrame({
+    'age_group': ['0-4', '5-14', '15-19', '20-24', '25-29', '30-34', '35-39', '40-44', '45-49', '50+'],
+    'female_cases': np.array([12, 8, 15, 10, 6, 4, 3, 2, 1, 2], dtype=np.int32),
+    'male_cases': np.array([10, 12, 18, 8, 5, 3, 2, 1, 1, 1], dtype=np.int32)
+}))
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes  
+@st.cache_data(ttl=3600, show_spinner=False)  # Cache for 1 hour; the sources change only on refresh
 def get_measles_attack_rates_by_age_sex(location=None, year=None, month=None):
     """
     Get measles attack rates by age and sex (cases per 100,000 population)
@@ -1839,452 +1584,286 @@ def get_measles_attack_rates_by_age_sex(location=None, year=None, month=None):
     try:
         with engine.connect() as conn:
             # Build filtering conditions
-            date_conditions = []
-            location_filter = ""
+            params = {}
             
-            if location and location != "National Level (MOH) - 1 units":
-                if "Region" in location:
-                    region_name = location.replace(" Region", "").replace("Regional Level - ", "").split(" regions")[0]
-                    location_filter = f" AND doh.region_name ILIKE '%{region_name}%'"
-                elif "District" in location:
-                    district_name = location.replace(" District", "").replace("District Level - ", "").split(" districts")[0]
-                    location_filter = f" AND doh.district_name ILIKE '%{district_name}%'"
+            location_filter, location_params = _location_filter(location)
+            params.update(location_params)
             
-            if year and month and month != f"All Months {year}":
-                month_name = month.split()[0]
-                month_num = {'January': 1, 'February': 2, 'March': 3, 'April': 4, 'May': 5, 'June': 6, 'July': 7, 'August': 8, 'September': 9, 'October': 10, 'November': 11, 'December': 12}.get(month_name, 1)
-                date_conditions.append(f"EXTRACT(YEAR FROM fe.first_event_date) = {year}")
-                date_conditions.append(f"EXTRACT(MONTH FROM fe.first_event_date) = {month_num}")
-            elif year:
-                date_conditions.append(f"EXTRACT(YEAR FROM fe.first_event_date) = {year}")
+            period = _period_range(year, month)
+            if period:
+                params['start_date'], params['end_date'] = period
             
-            date_filter = ""
-            if date_conditions:
-                date_filter = " AND " + " AND ".join(date_conditions)
+            org_join, date_filter, first_event_filter = _first_event_filters(location_filter, params)
             
             query = f"""
             WITH first_events AS (
                 SELECT 
-                    tracked_entity_instance_id,
-                    MIN(event_date) as first_event_date,
-                    dim_org_hierarchy_key
-                FROM dwh.fact_eidsr_event_data
-                WHERE data_element_id = 'qIlO7yEpiVv' AND data_value = 'Measles (B05.0_B05.9)'
-                  AND event_date IS NOT NULL
-                GROUP BY tracked_entity_instance_id, dim_org_hierarchy_key
+                    e.tracked_entity_instance_id,
+                    MIN(e.event_date) as first_event_date,
+                    e.dim_org_hierarchy_key
+                FROM dwh.measles_events() e
+                {org_join}
+                WHERE e.event_date IS NOT NULL
+                  AND e.tracked_entity_instance_id IS NOT NULL
+                  {date_filter}
+                GROUP BY e.tracked_entity_instance_id, e.dim_org_hierarchy_key
+                {first_event_filter}
             ),
             case_counts AS (
+                -- Age band and sex group are precomputed per entity in mv_measles_entity_age_sex;
+                -- cases without age/sex attributes count as 'Unknown'
                 SELECT
-                    CASE
-                        WHEN age_years.attribute_value ~ '^[0-9]+$' THEN
-                            CASE
-                                WHEN age_years.attribute_value::int BETWEEN 0 AND 4 THEN '0-4'
-                                WHEN age_years.attribute_value::int BETWEEN 5 AND 14 THEN '5-14'
-                                WHEN age_years.attribute_value::int BETWEEN 15 AND 19 THEN '15-19'
-                                WHEN age_years.attribute_value::int BETWEEN 20 AND 24 THEN '20-24'
-                                WHEN age_years.attribute_value::int BETWEEN 25 AND 29 THEN '25-29'
-                                WHEN age_years.attribute_value::int BETWEEN 30 AND 34 THEN '30-34'
-                                WHEN age_years.attribute_value::int BETWEEN 35 AND 39 THEN '35-39'
-                                WHEN age_years.attribute_value::int BETWEEN 40 AND 44 THEN '40-44'
-                                WHEN age_years.attribute_value::int BETWEEN 45 AND 49 THEN '45-49'
-                                WHEN age_years.attribute_value::int >= 50 THEN '50+'
-                                ELSE 'Unknown'
-                            END
-                        ELSE 'Unknown'
-                    END AS age_group,
-                    COUNT(CASE WHEN LOWER(sex.attribute_value) LIKE '%female%' THEN fe.tracked_entity_instance_id END) as female_cases,
-                    COUNT(CASE WHEN LOWER(sex.attribute_value) LIKE '%male%' AND LOWER(sex.attribute_value) NOT LIKE '%female%' THEN fe.tracked_entity_instance_id END) as male_cases
+                    COALESCE(a.age_band, 'Unknown') AS age_group,
+                    MIN(a.age_band_sort) AS age_sort,
+                    COUNT(*) FILTER (WHERE a.sex_group = 'Female') as female_cases,
+                    COUNT(*) FILTER (WHERE a.sex_group = 'Male') as male_cases
                 FROM first_events fe
-                LEFT JOIN dwh.fact_eidsr_tracked_entity_attributes age_years ON (
-                    age_years.entity_id = fe.tracked_entity_instance_id
-                    AND age_years.attribute_id = 'UezutfURtQG'
-                )
-                LEFT JOIN dwh.fact_eidsr_tracked_entity_attributes sex ON (
-                    sex.entity_id = fe.tracked_entity_instance_id
-                    AND sex.attribute_id = 'Rq4qM2wKYFL'
-                )
-                LEFT JOIN dwh.dim_eidsr_org_hierarchy doh ON (
-                    fe.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
-                )
-                WHERE 1=1
-                  {location_filter}
-                  {date_filter}
-                GROUP BY
-                    CASE
-                        WHEN age_years.attribute_value ~ '^[0-9]+$' THEN
-                            CASE
-                                WHEN age_years.attribute_value::int BETWEEN 0 AND 4 THEN '0-4'
-                                WHEN age_years.attribute_value::int BETWEEN 5 AND 14 THEN '5-14'
-                                WHEN age_years.attribute_value::int BETWEEN 15 AND 19 THEN '15-19'
-                                WHEN age_years.attribute_value::int BETWEEN 20 AND 24 THEN '20-24'
-                                WHEN age_years.attribute_value::int BETWEEN 25 AND 29 THEN '25-29'
-                                WHEN age_years.attribute_value::int BETWEEN 30 AND 34 THEN '30-34'
-                                WHEN age_years.attribute_value::int BETWEEN 35 AND 39 THEN '35-39'
-                                WHEN age_years.attribute_value::int BETWEEN 40 AND 44 THEN '40-44'
-                                WHEN age_years.attribute_value::int BETWEEN 45 AND 49 THEN '45-49'
-                                WHEN age_years.attribute_value::int >= 50 THEN '50+'
-                                ELSE 'Unknown'
-                            END
-                        ELSE 'Unknown'
-                    END
+                LEFT JOIN dwh.mv_measles_entity_age_sex a ON a.entity_id = fe.tracked_entity_instance_id
+                GROUP BY COALESCE(a.age_band, 'Unknown')
             )
             SELECT
                 age_group,
                 female_cases,
                 male_cases
             FROM case_counts
-            ORDER BY
-                CASE age_group
-                    WHEN '0-4' THEN 1
-                    WHEN '5-14' THEN 2
-                    WHEN '15-19' THEN 3
-                    WHEN '20-24' THEN 4
-                    WHEN '25-29' THEN 5
-                    WHEN '30-34' THEN 6
-                    WHEN '35-39' THEN 7
-                    WHEN '40-44' THEN 8
-                    WHEN '45-49' THEN 9
-                    WHEN '50+' THEN 10
-                    WHEN 'Unknown' THEN 11
-                    ELSE 12
-                END
+            ORDER BY age_sort NULLS LAST
             """
             
-            df = pd.read_sql_query(text(query), conn)
+            df = pd.read_sql_query(text(query), conn, params=params)
             
             if not df.empty:
-                # Calculate attack rates as simple rate per 100,000
-                # This is a standardized rate calculation for epidemiological data
-                df['female_attack_rate'] = (df['female_cases'] * 100000 / df['female_cases'].sum()).round(2)
-                df['male_attack_rate'] = (df['male_cases'] * 100000 / df['male_cases'].sum()).round(2)
-                
-                return df
+                return _add_attack_rates(df)
             else:
                 # Return placeholder data with calculated attack rates
-                placeholder_data = []
-                age_groups = ['0-4', '5-14', '15-19', '20-24', '25-29', '30-34', '35-39', '40-44', '45-49', '50+']
-                female_cases_data = [12, 8, 15, 10, 6, 4, 3, 2, 1, 2]
-                male_cases_data = [10, 12, 18, 8, 5, 3, 2, 1, 1, 1]
-                
-                # Calculate rates as proportion of total cases per 100,000
-                total_female = sum(female_cases_data)
-                total_male = sum(male_cases_data)
-                
-                for i, age_group in enumerate(age_groups):
-                    female_rate = (female_cases_data[i] * 100000 / total_female) if total_female > 0 else 0
-                    male_rate = (male_cases_data[i] * 100000 / total_male) if total_male > 0 else 0
-                    
-                    placeholder_data.append({
-                        'age_group': age_group,
-                        'female_cases': female_cases_data[i],
-                        'male_cases': male_cases_data[i],
-                        'female_attack_rate': round(female_rate, 2),
-                        'male_attack_rate': round(male_rate, 2)
-                    })
-                
-                return pd.DataFrame(placeholder_data)
+                return _PLACEHOLDER_ATTACK_RATES
             
     except Exception as e:
         st.error(f"Error fetching attack rates by age and sex: {str(e)}")
         # Return placeholder data
-        placeholder_data = []
-        age_groups = ['0-4', '5-14', '15-19', '20-24', '25-29', '30-34', '35-39', '40-44', '45-49', '50+']
-        female_cases_data = [12, 8, 15, 10, 6, 4, 3, 2, 1, 2]
-        male_cases_data = [10, 12, 18, 8, 5, 3, 2, 1, 1, 1]
-        
-        # Calculate rates as proportion of total cases per 100,000
-        total_female = sum(female_cases_data)
-        total_male = sum(male_cases_data)
-        
-        for i, age_group in enumerate(age_groups):
-            female_rate = (female_cases_data[i] * 100000 / total_female) if total_female > 0 else 0
-            male_rate = (male_cases_data[i] * 100000 / total_male) if total_male > 0 else 0
-            
-            placeholder_data.append({
-                'age_group': age_group,
-                'female_cases': female_cases_data[i],
-                'male_cases': male_cases_data[i],
-                'female_attack_rate': round(female_rate, 2),
-                'male_attack_rate': round(male_rate, 2)
-            })
+        return _PLACEHOLDER_ATTACK_RATES
+
+# Age bands of the deaths-by-age chart
+DEATH_AGE_LABELS = ['<1 year', '1-4 years', '5-14 years', '15-44 years', '45+ years']
+DEATH_AGE_BINS = [-1, 0, 4, 14, 44, np.inf]
+
+# Placeholder deaths per five-year age group (AGE_GROUP_LABELS without 'Unknown');
+# built once, callers get a copy or a scaled frame
+_PLACEHOLDER_DEATHS_AGE_SEX = pd.DataFrame({
+    'age_group': AGE_GROUP_LABELS[:-1],
+    'male_deaths': [1, 2, 1, 1, 0, 1, 0, 0, 0, 0, 0],
+    'female_deaths': [1, 2, 0, 1, 1, 0, 0, 0, 0, 0, 0]
+})
+
+def _placeholder_deaths_age_sex(multiplier):
+    """Placeholder deaths by age group and sex with counts scaled by multiplier"""
+    return _PLACEHOLDER_DEATHS_AGE_SEX.assign(
+        male_deaths=(_PLACEHOLDER_DEATHS_AGE_SEX['male_deaths'] * multiplier).astype(int),
+        female_deaths=(_PLACEHOLDER_DEATHS_AGE_SEX['female_deaths'] * multiplier).astype(int)
+    )
+
+# The death-events query hashes the attribute joins and sorts for DISTINCT ON: more
+# work_mem than the session default keeps both in memory, and a timeout tighter than
+# the engine's 60s turns a runaway national selection into an error on the panel
+_DEATH_EVENTS_SETTINGS = {'statement_timeout': '15s', 'work_mem': '128MB'}
+_DEATH_EVENTS_DTYPES = {'tracked_entity_instance_id': 'object', 'district': 'object', 'age_years': 'float64', 'sex': 'object'}
+
+# Read only by the deaths chart functions below, which build new frames from it; cached
+# as a resource so a hit hands back the shared frame instead of unpickling a copy
+@st.cache_resource(ttl=300)  # Cache for 5 minutes
+def _fetch_measles_death_events(location=None, year=None, month=None):
+    """
+    Get one row per measles case whose outcome is 'dead' (its first event in the
+    period), with the case's district, numeric age and sex; the deaths-by-district/
+    age/age-sex charts are all grouped from this frame, so the outcome and attribute
+    joins run once per selection and every chart counts each death once
+    
+    Args:
+        location (str): Selected location from parameters
+        year (int): Selected year from parameters
+        month (str): Selected month from parameters
         
-        return pd.DataFrame(placeholder_data)
+    Returns:
+        pandas.DataFrame: tracked_entity_instance_id, district, age_years (NaN when
+            missing or not a whole number) and sex ('Male', 'Female', 'Unknown', or None
+            when no sex is recorded); shared, read-only
+    """
+    # No try/except here: errors propagate to _get_measles_death_events, so a failed fetch is never cached
+    params = {}
+    
+    location_filter, location_params = _location_filter(location)
+    params.update(location_params)
+    
+    date_filter = ""
+    period = _period_range(year, month)
+    if period:
+        date_filter = " AND events.event_date >= :start_date AND events.event_date < :end_date"
+        params['start_date'], params['end_date'] = period
+    
+    query = f"""
+    -- Driven from the partial index tea_dead_outcome_idx; the age join repeats the
+    -- predicate of tea_numeric_age_idx, so non-numeric ages come back as NULL.
+    -- DISTINCT ON keeps each case's first event, so the charts count rows, not distinct ids
+    SELECT DISTINCT ON (events.tracked_entity_instance_id)
+        events.tracked_entity_instance_id,
+        doh.district_name as district,
+        age_years.attribute_value::int as age_years,
+        -- Classified once per row here, as classify_sex does, instead of in each chart
+        CASE
+            WHEN LOWER(sex.attribute_value) LIKE '%female%' THEN 'Female'
+            WHEN LOWER(sex.attribute_value) LIKE '%male%' THEN 'Male'
+            WHEN sex.attribute_value IS NOT NULL THEN 'Unknown'
+        END as sex
+    FROM dwh.measles_events() events
+    JOIN dwh.fact_eidsr_tracked_entity_attributes outcome ON (
+        outcome.entity_id = events.tracked_entity_instance_id
+        AND outcome.attribute_id = 'ulE2j2pFgDl'
+    )
+    LEFT JOIN dwh.dim_eidsr_org_hierarchy doh ON (
+        events.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
+    )
+    LEFT JOIN dwh.fact_eidsr_tracked_entity_attributes age_years ON (
+        age_years.entity_id = events.tracked_entity_instance_id
+        AND age_years.attribute_id = 'UezutfURtQG'
+        AND age_years.attribute_value ~ '^[0-9]+$'
+    )
+    LEFT JOIN dwh.fact_eidsr_tracked_entity_attributes sex ON (
+        sex.entity_id = events.tracked_entity_instance_id
+        AND sex.attribute_id = 'FZzQbW8AWVd'
+    )
+    WHERE LOWER(outcome.attribute_value) = 'dead'
+      {location_filter}
+      {date_filter}
+    ORDER BY events.tracked_entity_instance_id, events.event_date
+    """
+    
+    # COPY + pyarrow: the per-death rows never pass through a Python tuple each
+    return read_sql_copy(query, params, dtype=_DEATH_EVENTS_DTYPES, settings=_DEATH_EVENTS_SETTINGS)
+
+# After a failed fetch, serve an empty result for this long instead of re-querying the
+# database on every rerun (shared with choropleth_data)
+FAILURE_BACKOFF_SECONDS = 30
+
+# Selections whose death-events fetch failed -> time.monotonic() of the failure
+_death_events_failures = {}
+_EMPTY_DEATH_EVENTS = pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in _DEATH_EVENTS_DTYPES.items()})
+
+def _get_measles_death_events(location=None, year=None, month=None):
+    """
+    Cached death events for the selection, or an empty frame when the query fails
+    (retried at most once per FAILURE_BACKOFF_SECONDS, so the deaths charts and later
+    reruns do not each wait out the statement timeout again)
+    """
+    key = (location, year, month)
+    failed_at = _death_events_failures.get(key)
+    if failed_at is not None and time.monotonic() - failed_at < FAILURE_BACKOFF_SECONDS:
+        st.warning("Death data temporarily unavailable; retrying shortly.")
+        return _EMPTY_DEATH_EVENTS
+
+    try:
+        deaths = _fetch_measles_death_events(location=location, year=year, month=month)
+        _death_events_failures.pop(key, None)
+        return deaths
+
+    except Exception as e:
+        _death_events_failures[key] = time.monotonic()
+        st.error(f"Error fetching death events: {str(e)}")
+        return _EMPTY_DEATH_EVENTS
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
 def get_measles_deaths_by_district(location=None, year=None, month=None):
-    """Get measles deaths by district"""
+    """Get measles deaths by district, most deaths first"""
     try:
-        with engine.connect() as conn:
-            date_conditions = []
-            location_filter = ""
-            
-            if location and location != "National Level (MOH) - 1 units":
-                if "Region" in location:
-                    region_name = location.replace(" Region", "").replace("Regional Level - ", "").split(" regions")[0]
-                    location_filter = f" AND doh.region_name ILIKE '%{region_name}%'"
-                elif "District" in location:
-                    district_name = location.replace(" District", "").replace("District Level - ", "").split(" districts")[0]
-                    location_filter = f" AND doh.district_name ILIKE '%{district_name}%'"
-            
-            if year and month and month != f"All Months {year}":
-                month_name = month.split()[0]
-                month_num = {'January': 1, 'February': 2, 'March': 3, 'April': 4, 'May': 5, 'June': 6, 'July': 7, 'August': 8, 'September': 9, 'October': 10, 'November': 11, 'December': 12}.get(month_name, 1)
-                date_conditions.append(f"EXTRACT(YEAR FROM events.event_date) = {year}")
-                date_conditions.append(f"EXTRACT(MONTH FROM events.event_date) = {month_num}")
-            elif year:
-                date_conditions.append(f"EXTRACT(YEAR FROM events.event_date) = {year}")
-            
-            date_filter = ""
-            if date_conditions:
-                date_filter = " AND " + " AND ".join(date_conditions)
-            
-            query = f"""
-            WITH joined_data AS (
-                SELECT
-                    events.tracked_entity_instance_id,
-                    events.dim_org_hierarchy_key,
-                    outcome.attribute_value as outcome_value
-                FROM dwh.fact_eidsr_event_data events
-                LEFT JOIN dwh.fact_eidsr_tracked_entity_attributes outcome ON (
-                    outcome.entity_id = events.tracked_entity_instance_id
-                    AND outcome.attribute_id = 'ulE2j2pFgDl'
-                )
-                LEFT JOIN dwh.dim_eidsr_org_hierarchy doh ON (
-                    events.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
-                )
-                WHERE events.data_element_id = 'qIlO7yEpiVv' AND data_value = 'Measles (B05.0_B05.9)'
-                  AND LOWER(outcome.attribute_value) = 'dead'
-                  AND doh.district_name IS NOT NULL
-                  {location_filter}
-                  {date_filter}
-            )
-            SELECT 
-                doh.district_name as district,
-                COUNT(DISTINCT jd.tracked_entity_instance_id) as deaths
-            FROM joined_data jd
-            JOIN dwh.dim_eidsr_org_hierarchy doh ON jd.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
-            GROUP BY doh.district_name
-            HAVING COUNT(DISTINCT jd.tracked_entity_instance_id) > 0
-            ORDER BY deaths DESC
-            """
-            
-            df = pd.read_sql_query(text(query), conn)
-            return df
-            
+        deaths = _get_measles_death_events(location=location, year=year, month=month)
+        return (
+            deaths['district'].value_counts()
+            .rename_axis('district')
+            .reset_index(name='deaths')
+        )
+        
     except Exception as e:
         st.error(f"Error fetching deaths by district: {str(e)}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
 def get_measles_deaths_by_age(location=None, year=None, month=None):
-    """Get measles deaths by age group"""
+    """Get measles deaths by age group (DEATH_AGE_LABELS), for the bands with deaths"""
     try:
-        with engine.connect() as conn:
-            date_conditions = []
-            location_filter = ""
-            
-            if location and location != "National Level (MOH) - 1 units":
-                if "Region" in location:
-                    region_name = location.replace(" Region", "").replace("Regional Level - ", "").split(" regions")[0]
-                    location_filter = f" AND doh.region_name ILIKE '%{region_name}%'"
-                elif "District" in location:
-                    district_name = location.replace(" District", "").replace("District Level - ", "").split(" districts")[0]
-                    location_filter = f" AND doh.district_name ILIKE '%{district_name}%'"
-            
-            if year and month and month != f"All Months {year}":
-                month_name = month.split()[0]
-                month_num = {'January': 1, 'February': 2, 'March': 3, 'April': 4, 'May': 5, 'June': 6, 'July': 7, 'August': 8, 'September': 9, 'October': 10, 'November': 11, 'December': 12}.get(month_name, 1)
-                date_conditions.append(f"EXTRACT(YEAR FROM events.event_date) = {year}")
-                date_conditions.append(f"EXTRACT(MONTH FROM events.event_date) = {month_num}")
-            elif year:
-                date_conditions.append(f"EXTRACT(YEAR FROM events.event_date) = {year}")
-            
-            date_filter = ""
-            if date_conditions:
-                date_filter = " AND " + " AND ".join(date_conditions)
-            
-            query = f"""
-            WITH joined_data AS (
-                SELECT
-                    events.tracked_entity_instance_id,
-                    CASE
-                        WHEN age_years.attribute_value::int BETWEEN 0 AND 0 THEN '<1 year'
-                        WHEN age_years.attribute_value::int BETWEEN 1 AND 4 THEN '1-4 years'
-                        WHEN age_years.attribute_value::int BETWEEN 5 AND 14 THEN '5-14 years'
-                        WHEN age_years.attribute_value::int BETWEEN 15 AND 44 THEN '15-44 years'
-                        WHEN age_years.attribute_value::int >= 45 THEN '45+ years'
-                        ELSE 'Unknown'
-                    END AS age_group
-                FROM dwh.fact_eidsr_event_data events
-                LEFT JOIN dwh.fact_eidsr_tracked_entity_attributes age_years ON (
-                    age_years.entity_id = events.tracked_entity_instance_id
-                    AND age_years.attribute_id = 'UezutfURtQG'
-                )
-                LEFT JOIN dwh.fact_eidsr_tracked_entity_attributes outcome ON (
-                    outcome.entity_id = events.tracked_entity_instance_id
-                    AND outcome.attribute_id = 'ulE2j2pFgDl'
-                )
-                LEFT JOIN dwh.dim_eidsr_org_hierarchy doh ON (
-                    events.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
-                )
-                WHERE events.data_element_id = 'qIlO7yEpiVv' AND data_value = 'Measles (B05.0_B05.9)'
-                  AND age_years.attribute_value IS NOT NULL
-                  AND age_years.attribute_value ~ '^[0-9]+$'
-                  AND LOWER(outcome.attribute_value) = 'dead'
-                  {location_filter}
-                  {date_filter}
-            )
-            SELECT 
-                age_group,
-                COUNT(tracked_entity_instance_id) as deaths
-            FROM joined_data
-            WHERE age_group != 'Unknown'
-            GROUP BY age_group
-            ORDER BY 
-                CASE age_group
-                    WHEN '<1 year' THEN 1
-                    WHEN '1-4 years' THEN 2
-                    WHEN '5-14 years' THEN 3
-                    WHEN '15-44 years' THEN 4
-                    WHEN '45+ years' THEN 5
-                    ELSE 6
-                END
-            """
-            
-            df = pd.read_sql_query(text(query), conn)
-            return df
-            
+        deaths = _get_measles_death_events(location=location, year=year, month=month)
+        counts = pd.cut(deaths['age_years'].dropna(), bins=DEATH_AGE_BINS, labels=DEATH_AGE_LABELS).value_counts(sort=False)
+        counts = counts[counts > 0]
+        return pd.DataFrame({'age_group': counts.index.astype(str), 'deaths': counts.to_numpy()})
+        
     except Exception as e:
         st.error(f"Error fetching deaths by age: {str(e)}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
 def get_measles_deaths_by_age_sex(location=None, year=None, month=None):
-    """Get measles deaths by age group and sex using proper database queries"""
+    """Get measles deaths by five-year age group and sex"""
     try:
-        with engine.connect() as conn:
-            # Build year filter
-            year_filter = ""
-            if year:
-                if month and month != f"All Months {year}":
-                    month_name = month.split()[0]
-                    month_num = {'January': 1, 'February': 2, 'March': 3, 'April': 4, 'May': 5, 'June': 6, 'July': 7, 'August': 8, 'September': 9, 'October': 10, 'November': 11, 'December': 12}.get(month_name, 1)
-                    year_filter = f" AND EXTRACT(YEAR FROM events.event_date) = {year} AND EXTRACT(MONTH FROM events.event_date) = {month_num}"
-                else:
-                    year_filter = f" AND EXTRACT(YEAR FROM events.event_date) = {year}"
-            
-            # Build location filter
-            location_filter = ""
-            if location and location != "National Level (MOH) - 1 units":
-                if "Region" in location:
-                    region_name = location.replace(" Region", "").replace("Regional Level - ", "").split(" regions")[0]
-                    location_filter = f" AND doh.region_name ILIKE '%{region_name}%'"
-                elif "District" in location:
-                    district_name = location.replace(" District", "").replace("District Level - ", "").split(" districts")[0]
-                    location_filter = f" AND doh.district_name ILIKE '%{district_name}%'"
-            
-            query = f"""
-            WITH joined_data AS (
-                SELECT
-                    events.tracked_entity_instance_id,
-                    CASE
-                        WHEN age_years.attribute_value::int BETWEEN 0 AND 4 THEN '0-4'
-                        WHEN age_years.attribute_value::int BETWEEN 5 AND 9 THEN '5-9'
-                        WHEN age_years.attribute_value::int BETWEEN 10 AND 14 THEN '10-14'
-                        WHEN age_years.attribute_value::int BETWEEN 15 AND 19 THEN '15-19'
-                        WHEN age_years.attribute_value::int BETWEEN 20 AND 24 THEN '20-24'
-                        WHEN age_years.attribute_value::int BETWEEN 25 AND 29 THEN '25-29'
-                        WHEN age_years.attribute_value::int BETWEEN 30 AND 34 THEN '30-34'
-                        WHEN age_years.attribute_value::int BETWEEN 35 AND 39 THEN '35-39'
-                        WHEN age_years.attribute_value::int BETWEEN 40 AND 44 THEN '40-44'
-                        WHEN age_years.attribute_value::int BETWEEN 45 AND 49 THEN '45-49'
-                        WHEN age_years.attribute_value::int >= 50 THEN '50+'
-                        ELSE 'Unknown'
-                    END AS age_group,
-                    sex.attribute_value as sex
-                FROM dwh.fact_eidsr_event_data events
-                LEFT JOIN dwh.fact_eidsr_tracked_entity_attributes age_years ON (
-                    age_years.entity_id = events.tracked_entity_instance_id
-                    AND age_years.attribute_id = 'UezutfURtQG'
-                )
-                LEFT JOIN dwh.fact_eidsr_tracked_entity_attributes sex ON (
-                    sex.entity_id = events.tracked_entity_instance_id
-                    AND sex.attribute_id = 'FZzQbW8AWVd'
-                )
-                LEFT JOIN dwh.fact_eidsr_tracked_entity_attributes outcome ON (
-                    outcome.entity_id = events.tracked_entity_instance_id
-                    AND outcome.attribute_id = 'ulE2j2pFgDl'  -- Outcome attribute
-                )
-                LEFT JOIN dwh.dim_eidsr_org_hierarchy doh ON events.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
-                WHERE events.data_element_id = 'qIlO7yEpiVv' AND data_value = 'Measles (B05.0_B05.9)'
-                  AND age_years.attribute_value IS NOT NULL
-                  AND sex.attribute_value IS NOT NULL
-                  AND age_years.attribute_value ~ '^[0-9]+$'
-                  AND LOWER(outcome.attribute_value) = 'dead'
-                  {year_filter}
-                  {location_filter}
-            )
-            SELECT 
-                age_group,
-                COUNT(CASE WHEN LOWER(sex) LIKE '%male%' AND LOWER(sex) NOT LIKE '%female%' THEN tracked_entity_instance_id END) as male_deaths,
-                COUNT(CASE WHEN LOWER(sex) LIKE '%female%' THEN tracked_entity_instance_id END) as female_deaths
-            FROM joined_data
-            WHERE age_group != 'Unknown'
-            GROUP BY age_group
-            ORDER BY 
-                CASE age_group
-                    WHEN '0-4' THEN 1
-                    WHEN '5-9' THEN 2
-                    WHEN '10-14' THEN 3
-                    WHEN '15-19' THEN 4
-                    WHEN '20-24' THEN 5
-                    WHEN '25-29' THEN 6
-                    WHEN '30-34' THEN 7
-                    WHEN '35-39' THEN 8
-                    WHEN '40-44' THEN 9
-                    WHEN '45-49' THEN 10
-                    WHEN '50+' THEN 11
-                    ELSE 12
-                END
-            """
-            
-            df = pd.read_sql_query(text(query), conn)
-            
-            # If no real data, return parameter-adjusted placeholder data
-            if df.empty:
-                base_male = [1, 2, 1, 1, 0, 1, 0, 0, 0, 0, 0]
-                base_female = [1, 2, 0, 1, 1, 0, 0, 0, 0, 0, 0]
-                
-                # Apply parameter-based scaling
-                multiplier = 1.0
-                if location and location != "National Level (MOH) - 1 units":
-                    if "Region" in location:
-                        multiplier = 0.7
-                    elif "District" in location:
-                        multiplier = 0.4
-                
-                from datetime import datetime
-                if year and int(year) < datetime.now().year:
-                    multiplier *= 0.8
-                
-                adj_male = [max(0, int(m * multiplier)) for m in base_male]
-                adj_female = [max(0, int(f * multiplier)) for f in base_female]
-                
-                return pd.DataFrame({
-                    'age_group': ['0-4', '5-9', '10-14', '15-19', '20-24', '25-29', '30-34', '35-39', '40-44', '45-49', '50+'],
-                    'male_deaths': adj_male,
-                    'female_deaths': adj_female
-                })
-            
-            return df
-            
+        deaths = _get_measles_death_events(location=location, year=year, month=month)
+        deaths = deaths.dropna(subset=['age_years', 'sex'])
+        
+        df = pd.crosstab(
+            pd.cut(deaths['age_years'], bins=AGE_GROUP_BINS, labels=AGE_GROUP_LABELS[:-1]),
+            deaths['sex']
+        )
+        # Only bands with deaths of any sex
+        df = df[df.sum(axis=1) > 0]
+        df = (
+            df.reindex(columns=['Male', 'Female'], fill_value=0)
+            .rename(columns={'Male': 'male_deaths', 'Female': 'female_deaths'})
+            .rename_axis(index='age_group', columns=None)
+            .reset_index()
+        )
+        df['age_group'] = df['age_group'].astype(str)
+        
+        # If no real data, return parameter-adjusted placeholder data
+        if df.empty:
+            return _placeholder_deaths_age_sex(_placeholder_multiplier(location, year))
+        
+        return df
+        
     except Exception as e:
         st.error(f"Error fetching deaths by age and sex: {str(e)}")
-        return pd.DataFrame({
-            'age_group': ['0-4', '5-9', '10-14', '15-19', '20-24', '25-29', '30-34', '35-39', '40-44', '45-49', '50+'],
-            'male_deaths': [1, 2, 1, 1, 0, 1, 0, 0, 0, 0, 0],
-            'female_deaths': [1, 2, 0, 1, 1, 0, 0, 0, 0, 0, 0]
-        })
+        # Not cached, so hand out a copy of the shared frame
+        return _PLACEHOLDER_DEATHS_AGE_SEX.copy()
+
+
+def clear_caches():
+    """
+    Drop every cached query result: st.cache_data, st.cache_resource and the
+    on-disk parquet copies. Use after a warehouse load so the next run re-queries
+    """
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    for path in RESULT_CACHE_DIR.glob('*.parquet'):
+        path.unlink(missing_ok=True)
+
+
+def get_dashboard_bundle(location=None, year=None, month=None):
+    """
+    Fetch the location/period views of the report concurrently, one pooled
+    connection per query, so a cold page waits for the slowest query only
+    
+    Args:
+        location (str): Selected location from parameters
+        year (int): Selected year from parameters
+        month (str): Selected month from parameters
+        
+    Returns:
+        dict: reporting_metrics, weekly_time_series, weekly_by_sex and epicurves
+    """
+    filters = dict(location=location, year=year, month=month)
+    reporting_metrics, weekly_time_series, weekly_by_sex, epicurves = fetch_concurrently(
+        lambda: get_district_reporting_metrics(**filters),
+        lambda: get_measles_weekly_time_series(**filters),
+        lambda: get_measles_weekly_by_sex(**filters),
+        lambda: get_measles_top_districts_epicurves(**filters),
+    )
+    return {
+        'reporting_metrics': reporting_metrics,
+        'weekly_time_series': weekly_time_series,
+        'weekly_by_sex': weekly_by_sex,
+        'epicurves': epicurves
+    }
 
 
 def format_table_for_display(df):
@@ -2292,8 +1871,5 @@ def format_table_for_display(df):
     if df.empty:
         return df
     
-    # Rename columns for display
-    display_df = df.copy()
-    display_df.columns = ['District', 'Total Cases', 'Cases (Last 30 Days)', 'First Case', 'Latest Case']
-    
-    return display_df
\ No newline at end of file
+    # Rename columns for display; only the labels change, so the data is shared, not copied
+    return df.set_axis(['District', 'Total Cases', 'Cases (Last 30 Days)', 'First Case', 'Latest Case'], axis=1, copy=False)
\ No newline at end of file
@@ -12,6 +12,8 @@ import streamlit.components.v1 as components
 from datetime import datetime, timedelta
 import os
 import base64
+import hmac
+import threading
 import pandas as pd
 
 # Page configuration
@@ -448,9 +450,30 @@ def render_main_header(params):
 
 
 
+@st.cache_resource
+def start_connection_pool_warmup():
+    """Open the database pool's connections in the background, once per server process"""
+    from config import warm_pool
+    thread = threading.Thread(target=warm_pool, name="db-pool-warmup", daemon=True)
+    thread.start()
+    return thread
+
 def main():
     """Main function to run the Measles report template"""
     
+    # Operator trigger after a warehouse load: ?clear_cache=<CLEAR_CACHE_TOKEN> drops every
+    # cached result (including the on-disk parquet copies), then the parameter is removed so
+    # reruns keep caching. Disabled unless CLEAR_CACHE_TOKEN is set in the environment/.env
+    clear_cache_token = st.query_params.get("clear_cache")
+    if clear_cache_token:
+        from config import CLEAR_CACHE_TOKEN
+        if CLEAR_CACHE_TOKEN and hmac.compare_digest(clear_cache_token.encode(), CLEAR_CACHE_TOKEN.encode()):
+            from data_fetcher import clear_caches
+            clear_caches()
+        del st.query_params["clear_cache"]
+    
+    # Connections open while the page chrome renders, ahead of the first queries
+    start_connection_pool_warmup()
     
     # Add comprehensive print-friendly styles with optimized spacing
     st.markdown("""
@@ -1184,15 +1207,18 @@ def main():
             get_measles_weekly_data, 
             get_measles_age_sex_distribution,
             get_measles_top_10_districts,
-            get_measles_cases_last_24h,
-            get_measles_total_deaths
+            get_all_kpis,
+            fetch_concurrently
         )
         
-        # Get real data for summary
-        weekly_data = get_measles_weekly_data()
-        district_data = get_measles_top_10_districts()
-        cases_24h = get_measles_cases_last_24h()
-        total_deaths = get_measles_total_deaths()  # Get consistent death data
+        # Get real data for summary; the three queries are independent, so issue them together
+        weekly_data, district_data, kpis = fetch_concurrently(
+            get_measles_weekly_data,
+            get_measles_top_10_districts,
+            get_all_kpis
+        )
+        cases_24h = kpis['cases_24h']
+        total_deaths = kpis['total_deaths']  # Get consistent death data
         
         # Calculate summary statistics
         summary_stats = {}
@@ -1595,6 +1621,13 @@ def main():
         # Get the selected parameters
         params = get_dynamic_parameters() if 'params' not in locals() else params
         
+        # One query serves all three pie charts
+        reporting_data = get_district_reporting_metrics(
+            location=params['location'],
+            year=params['year'],
+            month=params['month']
+        )
+        
         # Create three pie charts in columns
         col1, col2, col3 = st.columns(3)
         
@@ -1602,12 +1635,6 @@ def main():
         with col1:
             st.markdown('<div class="subsection-header"><h4>% Districts Reporting Cases</h4></div>', unsafe_allow_html=True)
             try:
-                reporting_data = get_district_reporting_metrics(
-                    location=params['location'],
-                    year=params['year'],
-                    month=params['month']
-                )
-                
                 if reporting_data and 'districts_with_cases' in reporting_data:
                     districts_with_cases = reporting_data['districts_with_cases']
                     total_districts = reporting_data['total_districts']
@@ -1656,12 +1683,7 @@ def main():
         with col2:
             st.markdown("#### Districts Reporting Cases in Last 21 Days")
             try:
-                reporting_21_data = get_district_reporting_metrics(
-                    location=params['location'],
-                    year=params['year'],
-                    month=params['month'],
-                    days_filter=21
-                )
+                reporting_21_data = reporting_data
                 
                 if reporting_21_data and 'districts_reporting_recent' in reporting_21_data:
                     recent_districts = reporting_21_data['districts_reporting_recent']
@@ -1711,12 +1733,7 @@ def main():
         with col3:
             st.markdown("#### Reporting Cases in Last 24 Hours")
             try:
-                reporting_24h_data = get_district_reporting_metrics(
-                    location=params['location'],
-                    year=params['year'],
-                    month=params['month'],
-                    hours_filter=24
-                )
+                reporting_24h_data = reporting_data
                 
                 if reporting_24h_data and 'districts_reporting_24h' in reporting_24h_data:
                     recent_24h_districts = reporting_24h_data['districts_reporting_24h']
@@ -1775,12 +1792,19 @@ def main():
        
         
         # Get weekly time series data from database
-        from data_fetcher import get_measles_weekly_time_series, get_measles_weekly_by_sex, get_measles_top_districts_epicurves
+        from data_fetcher import get_dashboard_bundle
         
         # Get the current parameters (ensure params is available)
         if 'params' not in locals():
             params = get_dynamic_parameters()
         
+        # The section's queries are independent, so fetch them together
+        bundle = get_dashboard_bundle(
+            location=params['location'],
+            year=params['year'],
+            month=params['month']
+        )
+        
         # Create two side-by-side charts with equal spacing
         col1, col2 = st.columns(2, gap="medium")
 
@@ -1788,11 +1812,7 @@ def main():
         with col1:
             st.markdown("#### Weekly Cases & 7-Day Average")
             try:
-                weekly_data = get_measles_weekly_time_series(
-                    location=params['location'],
-                    year=params['year'],
-                    month=params['month']
-                )
+                weekly_data = bundle['weekly_time_series']
                 
                 if not weekly_data.empty:
                     # Create subplot for weekly cases and moving average
@@ -1865,11 +1885,7 @@ def main():
         with col2:
             st.markdown("#### Weekly Cases by Sex")
             try:
-                sex_data = get_measles_weekly_by_sex(
-                    location=params['location'],
-                    year=params['year'],
-                    month=params['month']
-                )
+                sex_data = bundle['weekly_by_sex']
                 
                 if not sex_data.empty:
                     fig_sex = go.Figure()
@@ -1943,11 +1959,7 @@ def main():
         st.markdown("Weekly incident cases across epidemiological weeks for the most affected districts.")
 
         try:
-            epicurve_data = get_measles_top_districts_epicurves(
-                location=params['location'],
-                year=params['year'],
-                month=params['month']
-            )
+            epicurve_data = bundle['epicurves']
 
             if epicurve_data:
                 # Define distinct colors for each district (extended to 12 colors)
@@ -2038,12 +2050,19 @@ def main():
 
         
         # Get proportion data from database
-        from data_fetcher import get_district_weekly_proportions, get_district_total_proportions
+        from data_fetcher import get_district_weekly_proportions, get_district_total_proportions, fetch_concurrently
         
         # Get the current parameters
         if 'params' not in locals():
             params = get_dynamic_parameters()
         
+        # The two charts' queries are independent, so issue them together
+        filters = dict(location=params['location'], year=params['year'], month=params['month'])
+        district_prop_data, weekly_prop_data = fetch_concurrently(
+            lambda: get_district_total_proportions(**filters),
+            lambda: get_district_weekly_proportions(**filters)
+        )
+        
         # Create two side-by-side charts
         col1, col2 = st.columns(2, gap="medium")
 
@@ -2051,12 +2070,6 @@ def main():
         with col1:
             st.markdown("#### Total Case Proportions by District")
             try:
-                district_prop_data = get_district_total_proportions(
-                    location=params['location'],
-                    year=params['year'],
-                    month=params['month']
-                )
-                
                 if not district_prop_data.empty:
                     # Take top 5 districts for consistency with right chart
                     top_districts = district_prop_data.head(5).sort_values('proportion', ascending=True)
@@ -2119,12 +2132,6 @@ def main():
         with col2:
             st.markdown("#### Weekly Case Proportions - Top 5 Districts")
             try:
-                weekly_prop_data = get_district_weekly_proportions(
-                    location=params['location'],
-                    year=params['year'],
-                    month=params['month']
-                )
-
                 if not weekly_prop_data.empty:
                     fig_weekly_prop = go.Figure()
 
@@ -2206,13 +2213,24 @@ def main():
             get_measles_gender_distribution, 
             get_measles_age_sex_distribution,
             get_measles_deaths_by_district,
-            get_measles_attack_rates_by_age_sex
+            get_measles_attack_rates_by_age_sex,
+            fetch_concurrently
         )
         
         # Get the current parameters
         if 'params' not in locals():
             params = get_dynamic_parameters()
         
+        # The section's chart queries are independent, so issue them together
+        filters = dict(location=params['location'], year=params['year'], month=params['month'])
+        # (the attack rates are charted in the separate section below)
+        gender_data, age_sex_data, deaths_district_data, attack_rates_data = fetch_concurrently(
+            lambda: get_measles_gender_distribution(**filters),
+            lambda: get_measles_age_sex_distribution(**filters),
+            get_measles_deaths_by_district,
+            lambda: get_measles_attack_rates_by_age_sex(**filters)
+        )
+        
         # Debug: Show current parameters for demographic section
         # st.info(f"Demographic Analysis - Using parameters: Year: {params['year']}, Location: {params['location']}")
         
@@ -2224,12 +2242,6 @@ def main():
         with col1:
             st.markdown("##### Gender Distribution")
             try:
-                gender_data = get_measles_gender_distribution(
-                    location=params['location'],
-                    year=params['year'],
-                    month=params['month']
-                )
-
                 if not gender_data.empty:
                     fig_gender = go.Figure(data=[go.Pie(
                         labels=gender_data['gender'],
@@ -2262,12 +2274,6 @@ def main():
         with col2:
             st.markdown("##### Distribution of Age and Sex")
             try:
-                age_sex_data = get_measles_age_sex_distribution(
-                    location=params['location'],
-                    year=params['year'],
-                    month=params['month']
-                )
-                
                 if not age_sex_data.empty:
                     fig_pyramid = go.Figure()
 
@@ -2379,7 +2385,9 @@ def main():
         with col1:
             st.markdown("##### Measles Deaths by District")
             try:
-                deaths_district_data = get_measles_deaths_by_district()
+                deaths_district_data = deaths_district_data.rename(
+                    columns={'district': 'District', 'deaths': 'Deaths'}
+                )
                 
                 if not deaths_district_data.empty:
                     fig_deaths_district = go.Figure()
@@ -2471,11 +2479,14 @@ def main():
         if 'params' not in locals():
             params = get_dynamic_parameters()
         
-        attack_rates_data = get_measles_attack_rates_by_age_sex(
-            location=params['location'],
-            year=params['year'],
-            month=params['month']
-        )
+        # Normally fetched with the demographic charts above
+        if 'attack_rates_data' not in locals():
+            from data_fetcher import get_measles_attack_rates_by_age_sex
+            attack_rates_data = get_measles_attack_rates_by_age_sex(
+                location=params['location'],
+                year=params['year'],
+                month=params['month']
+            )
         
         if not attack_rates_data.empty:
             import plotly.graph_objects as go
@@ -2646,8 +2657,8 @@ def main():
             
             # Prepare district names for matching
             locations = [feature['properties']['name'] for feature in district_features]
-            z_values = [cumulative_cases.get(loc, 0) for loc in locations]
-            max_cumulative = max(z_values) if z_values else 0
+            z_values = cumulative_cases.values_for(locations)
+            max_cumulative = z_values.max() if z_values.size else 0
 
             fig_cumulative = go.Figure(data=go.Choroplethmapbox(
                 geojson=districts_geojson,
@@ -2739,8 +2750,8 @@ def main():
             st.markdown("<h4 style='font-size: 18px; margin-bottom: 10px;'>District Reporting Last 21 Days</h4>", unsafe_allow_html=True)
             
             # Prepare data for reporting map
-            z_values_reporting = [reporting_21_days.get(loc, 0) for loc in locations]
-            max_reporting = max(z_values_reporting) if z_values_reporting else 0
+            z_values_reporting = reporting_21_days.values_for(locations)
+            max_reporting = z_values_reporting.max() if z_values_reporting.size else 0
 
             fig_reporting = go.Figure(data=go.Choroplethmapbox(
                 geojson=districts_geojson,
@@ -2827,8 +2838,8 @@ def main():
             st.markdown("<h4 style='font-size: 18px; margin-bottom: 10px;'>Attack Rates per 100K Population by Place (Cumulative)</h4>", unsafe_allow_html=True)
             
             # Prepare data for attack rates map
-            z_values_attack = [attack_rates.get(loc, 0) for loc in locations]
-            max_attack = max(z_values_attack) if z_values_attack else 0
+            z_values_attack = attack_rates.values_for(locations)
+            max_attack = z_values_attack.max() if z_values_attack.size else 0
 
             fig_attack = go.Figure(data=go.Choroplethmapbox(
                 geojson=districts_geojson,
@@ -2920,8 +2931,8 @@ def main():
             st.markdown("<h4 style='font-size: 18px; margin-bottom: 10px;'>Current Case Rate by District (Last 21 Days, Per 100K)</h4>", unsafe_allow_html=True)
             
             # Prepare data for current rates map
-            z_values_current = [current_rates.get(loc, 0) for loc in locations]
-            max_current = max(z_values_current) if z_values_current else 0
+            z_values_current = current_rates.values_for(locations)
+            max_current = z_values_current.max() if z_values_current.size else 0
 
             fig_current = go.Figure(data=go.Choroplethmapbox(
                 geojson=districts_geojson,
@@ -0,0 +1,79 @@
+-- Indexes supporting the measles dashboard queries.
+-- Apply with: psql -d uganda_dwh -f schema/indexes.sql
+-- CREATE INDEX CONCURRENTLY cannot run inside a transaction, so run this file in autocommit mode.
+
+-- Measles events: partial covering index holding every column dwh.mv_measles_events
+-- reads, so the view refresh is an index-only scan of the measles rows instead of a
+-- sequential scan of the whole fact table. It has no event_date IS NOT NULL condition
+-- because the view keeps undated events too.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_fed_measles_events
+    ON dwh.fact_eidsr_event_data (event_date, dim_org_hierarchy_key)
+    INCLUDE (event_id, tracked_entity_instance_id)
+    WHERE data_element_id = 'qIlO7yEpiVv'
+      AND data_value = 'Measles (B05.0_B05.9)';
+
+-- Superseded by idx_fed_measles_events, which covers a superset of its rows and columns
+DROP INDEX CONCURRENTLY IF EXISTS dwh.idx_fact_measles;
+
+-- Death outcome attributes: partial index over the few rows matching the death
+-- predicate used by get_all_kpis, so the attribute table is driven from
+-- this index instead of lower()-ing every row. The WHERE clause must stay identical
+-- to the query's for the planner to use it.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS tea_death_attr_idx
+    ON dwh.fact_eidsr_tracked_entity_attributes (entity_id)
+    WHERE LOWER(display_name) LIKE '%death%'
+      AND (LOWER(attribute_value) LIKE '%death%' OR
+           LOWER(attribute_value) LIKE '%died%' OR
+           LOWER(attribute_value) LIKE '%dead%' OR
+           LOWER(attribute_value) = 'yes');
+
+-- Trigram index so the other LOWER(display_name) LIKE '%...%' filters (age, sex,
+-- gender) can use a bitmap index scan
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS tea_display_name_trgm_idx
+    ON dwh.fact_eidsr_tracked_entity_attributes USING gin (LOWER(display_name) gin_trgm_ops);
+
+-- Trigram index on data element names: serves the '%outcome%'/'%status%'/'%result%'
+-- death lookup in get_measles_top_10_districts, which otherwise scans the whole fact
+-- table (GIN trigram handles LIKE and ILIKE). Keep predicates on the bare column, not
+-- LOWER(...), or this index is not used
+CREATE INDEX CONCURRENTLY IF NOT EXISTS fact_event_element_name_trgm_idx
+    ON dwh.fact_eidsr_event_data USING gin (data_element_display_name gin_trgm_ops);
+
+-- Case outcome 'dead': partial index on the outcome attribute so the deaths-by-district,
+-- -age and -age/sex queries probe only the recorded deaths
+CREATE INDEX CONCURRENTLY IF NOT EXISTS tea_dead_outcome_idx
+    ON dwh.fact_eidsr_tracked_entity_attributes (entity_id)
+    WHERE attribute_id = 'ulE2j2pFgDl'
+      AND LOWER(attribute_value) = 'dead';
+
+-- Numeric age attributes: the deaths-by-age queries probe by entity and keep only
+-- '^[0-9]+$' values, so this partial index answers the probe and the regex check
+-- without visiting the heap
+CREATE INDEX CONCURRENTLY IF NOT EXISTS tea_numeric_age_idx
+    ON dwh.fact_eidsr_tracked_entity_attributes (entity_id) INCLUDE (attribute_value)
+    WHERE attribute_id = 'UezutfURtQG'
+      AND attribute_value ~ '^[0-9]+$';
+
+-- Sex attribute read by the deaths query: a probe by entity answered from the index,
+-- value included, instead of a heap visit per death
+CREATE INDEX CONCURRENTLY IF NOT EXISTS tea_sex_attr_idx
+    ON dwh.fact_eidsr_tracked_entity_attributes (entity_id) INCLUDE (attribute_value)
+    WHERE attribute_id = 'FZzQbW8AWVd';
+
+-- Org hierarchy lookups by key that only need the district/region names are served
+-- by an index-only scan
+CREATE INDEX CONCURRENTLY IF NOT EXISTS org_hierarchy_key_names_idx
+    ON dwh.dim_eidsr_org_hierarchy (dim_org_hierarchy_key) INCLUDE (district_name, region_name);
+
+-- Location filters match the dropdown token with ILIKE '%name%' (district names carry a
+-- " District" suffix the token does not), so they need trigram indexes, not B-trees
+CREATE INDEX CONCURRENTLY IF NOT EXISTS org_hierarchy_region_name_trgm_idx
+    ON dwh.dim_eidsr_org_hierarchy USING gin (region_name gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS org_hierarchy_district_name_trgm_idx
+    ON dwh.dim_eidsr_org_hierarchy USING gin (district_name gin_trgm_ops);
+
+-- Refresh statistics and the visibility map so index-only scans are chosen
+VACUUM ANALYZE dwh.fact_eidsr_event_data;
+VACUUM ANALYZE dwh.fact_eidsr_tracked_entity_attributes;
+VACUUM ANALYZE dwh.dim_eidsr_org_hierarchy;
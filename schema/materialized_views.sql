@@ -0,0 +1,198 @@
+-- Materialized views used by the measles dashboard.
+-- Apply once with: psql -d uganda_dwh -f schema/materialized_views.sql
+-- Keep them current with schema/refresh.sql (see README).
+
+-- Org units that belong to a real district. Filtering the hierarchy once here keeps
+-- the district_name checks out of every dashboard query and gives joins a smaller build side.
+CREATE MATERIALIZED VIEW IF NOT EXISTS dwh.dim_valid_districts AS
+SELECT
+    dim_org_hierarchy_key,
+    district_name
+FROM dwh.dim_eidsr_org_hierarchy
+WHERE district_name IS NOT NULL
+  AND district_name NOT IN ('Unknown', '1 Test District');
+
+-- Unique index is required for REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS dim_valid_districts_key_idx
+    ON dwh.dim_valid_districts (dim_org_hierarchy_key);
+
+-- Distinct data elements in the event fact table. Name searches (e.g. the demographic
+-- field discovery) filter this lookup and join back to the facts by id.
+CREATE MATERIALIZED VIEW IF NOT EXISTS dwh.dim_data_elements AS
+SELECT DISTINCT
+    data_element_id,
+    data_element_display_name
+FROM dwh.fact_eidsr_event_data
+WHERE data_element_id IS NOT NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS dim_data_elements_key_idx
+    ON dwh.dim_data_elements (data_element_id, data_element_display_name);
+
+-- Measles events, deduplicated once. Every dashboard query reads this (through
+-- dwh.measles_events() below) instead of re-filtering dwh.fact_eidsr_event_data
+-- on the measles data element.
+CREATE MATERIALIZED VIEW IF NOT EXISTS dwh.mv_measles_events AS
+SELECT DISTINCT
+    event_id,
+    tracked_entity_instance_id,
+    event_date,
+    dim_org_hierarchy_key
+FROM dwh.fact_eidsr_event_data
+WHERE data_element_id = 'qIlO7yEpiVv'
+  AND data_value = 'Measles (B05.0_B05.9)';
+
+CREATE UNIQUE INDEX IF NOT EXISTS mv_measles_events_row_idx
+    ON dwh.mv_measles_events (event_id, tracked_entity_instance_id, event_date, dim_org_hierarchy_key);
+CREATE INDEX IF NOT EXISTS mv_measles_events_date_idx
+    ON dwh.mv_measles_events (event_date);
+CREATE INDEX IF NOT EXISTS mv_measles_events_org_idx
+    ON dwh.mv_measles_events (dim_org_hierarchy_key);
+-- Per-case probes (outcome/attribute joins, first event per case) read the case's
+-- events in date order with their org unit from this index alone
+CREATE INDEX IF NOT EXISTS mv_measles_events_tei_date_idx
+    ON dwh.mv_measles_events (tracked_entity_instance_id, event_date) INCLUDE (dim_org_hierarchy_key);
+-- Superseded by mv_measles_events_tei_date_idx
+DROP INDEX IF EXISTS dwh.mv_measles_events_tei_idx;
+
+-- Single entry point for the measles event set used by the dashboard queries.
+-- A one-statement STABLE SQL function is inlined by the planner, so date and org
+-- filters in the calling query still reach the indexes above. The view is already
+-- deduplicated, so no DISTINCT here. Returning the view's row type keeps the
+-- column names and types in one place.
+CREATE OR REPLACE FUNCTION dwh.measles_events()
+RETURNS SETOF dwh.mv_measles_events
+LANGUAGE sql STABLE PARALLEL SAFE
+AS $$
+    SELECT event_id, tracked_entity_instance_id, event_date, dim_org_hierarchy_key
+    FROM dwh.mv_measles_events
+$$;
+
+-- Age and sex parsed once per measles event from the free-text demographic fields,
+-- so get_measles_demographic_data aggregates plain columns instead of running the
+-- regex parse on every row of every request. Built from mv_measles_events, so refresh
+-- it after that view.
+CREATE MATERIALIZED VIEW IF NOT EXISTS dwh.mv_measles_demographics AS
+WITH demographic_fields AS (
+    -- One pass over the event's data values, pivoted with FILTER instead of a self-join
+    -- per field; '%birth%' also covers the 'date of birth'/'birth date' spellings
+    SELECT
+        me.event_id,
+        me.event_date,
+        MAX(fed.data_value) FILTER (
+            WHERE fed.data_element_display_name ILIKE '%birth%' OR fed.data_element_display_name ILIKE '%dob%'
+        ) AS dob_value,
+        MAX(fed.data_value) FILTER (WHERE fed.data_element_display_name ILIKE '%age%') AS age_direct_value,
+        MAX(fed.data_value) FILTER (WHERE fed.data_element_display_name ILIKE '%sex%') AS sex_field_value,
+        MAX(fed.data_value) FILTER (WHERE fed.data_element_display_name ILIKE '%gender%') AS gender_field_value,
+        MAX(fed.data_value) FILTER (
+            WHERE fed.data_element_display_name ILIKE '%male%' OR fed.data_element_display_name ILIKE '%female%'
+        ) AS male_female_field_value
+    FROM (SELECT DISTINCT event_id, event_date FROM dwh.mv_measles_events) me
+    JOIN dwh.fact_eidsr_event_data fed ON fed.event_id = me.event_id
+    WHERE fed.data_element_display_name ILIKE ANY (ARRAY['%birth%', '%dob%', '%age%', '%sex%', '%gender%', '%male%'])
+    GROUP BY me.event_id, me.event_date
+),
+demographic_data AS (
+    SELECT
+        event_id,
+        event_date,
+        -- Date of birth first, falling back to a direct age
+        COALESCE(dob_value, age_direct_value) AS birth_or_age_value,
+        COALESCE(sex_field_value, gender_field_value, male_female_field_value, 'Unknown') AS sex_value
+    FROM demographic_fields
+)
+SELECT
+    event_id,
+    event_date,
+    -- Age from date of birth or the direct age value, as of the last refresh
+    CASE
+        -- If it looks like a date (YYYY-MM-DD or similar)
+        WHEN birth_or_age_value ~ '^[0-9]{4}-[0-9]{2}-[0-9]{2}' THEN
+            EXTRACT(YEAR FROM AGE(CURRENT_DATE, birth_or_age_value::DATE))::INTEGER
+        -- If it looks like a date (DD/MM/YYYY or MM/DD/YYYY)
+        WHEN birth_or_age_value ~ '^[0-9]{2}/[0-9]{2}/[0-9]{4}' THEN
+            EXTRACT(YEAR FROM AGE(CURRENT_DATE, TO_DATE(birth_or_age_value, 'DD/MM/YYYY')))::INTEGER
+        -- If it's just a number (direct age)
+        WHEN birth_or_age_value ~ '^[0-9]+$' THEN
+            CAST(birth_or_age_value AS INTEGER)
+        -- If it contains 'month' or 'week' (infant)
+        WHEN LOWER(birth_or_age_value) LIKE '%month%' OR LOWER(birth_or_age_value) LIKE '%week%' THEN
+            0
+        -- Extract number from text like '25 years'
+        WHEN birth_or_age_value ~ '[0-9]+' THEN
+            CAST(REGEXP_REPLACE(birth_or_age_value, '[^0-9]', '', 'g') AS INTEGER)
+        ELSE NULL
+    END AS age_years,
+    -- Standardize sex values
+    CASE
+        WHEN LOWER(sex_value) LIKE '%male%' AND LOWER(sex_value) NOT LIKE '%female%' THEN 'Male'
+        WHEN LOWER(sex_value) LIKE '%female%' THEN 'Female'
+        ELSE 'Unknown'
+    END AS sex_group
+FROM demographic_data
+WHERE birth_or_age_value IS NOT NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS mv_measles_demographics_row_idx
+    ON dwh.mv_measles_demographics (event_id, event_date);
+CREATE INDEX IF NOT EXISTS mv_measles_demographics_date_idx
+    ON dwh.mv_measles_demographics (event_date);
+
+-- Age and sex attributes of every measles case, one row per tracked entity, with the
+-- integer age and attack-rate age band worked out at refresh instead of a regex and
+-- cast per row of every request. Built from mv_measles_events, so refresh it after
+-- that view.
+CREATE MATERIALIZED VIEW IF NOT EXISTS dwh.mv_measles_entity_age_sex AS
+WITH entity_attributes AS (
+    SELECT
+        tea.entity_id,
+        MAX(tea.attribute_value) FILTER (WHERE tea.attribute_id = 'UezutfURtQG') AS age_value,
+        MAX(tea.attribute_value) FILTER (WHERE tea.attribute_id = 'Rq4qM2wKYFL') AS sex_value
+    FROM dwh.fact_eidsr_tracked_entity_attributes tea
+    WHERE tea.attribute_id IN ('UezutfURtQG', 'Rq4qM2wKYFL')
+      AND tea.entity_id IN (SELECT tracked_entity_instance_id FROM dwh.mv_measles_events)
+    GROUP BY tea.entity_id
+),
+ages AS (
+    SELECT
+        entity_id,
+        age_value,
+        sex_value,
+        -- Cast once per entity; non-numeric ages become NULL
+        CASE WHEN age_value ~ '^[0-9]+$' THEN age_value::int END AS age_years
+    FROM entity_attributes
+),
+age_bands AS (
+    SELECT
+        entity_id,
+        age_value,
+        age_years,
+        sex_value,
+        -- One binary search over the band lower bounds instead of a CASE ladder
+        COALESCE(
+            (ARRAY['0-4', '5-14', '15-19', '20-24', '25-29', '30-34', '35-39', '40-44', '45-49', '50+'])[
+                WIDTH_BUCKET(age_years, ARRAY[5, 15, 20, 25, 30, 35, 40, 45, 50]) + 1
+            ],
+            'Unknown'
+        ) AS age_band
+    FROM ages
+)
+SELECT
+    entity_id,
+    age_value,
+    age_years,
+    sex_value,
+    age_band,
+    -- Chart order of the bands, so readers sort on an integer instead of a CASE
+    array_position(
+        ARRAY['0-4', '5-14', '15-19', '20-24', '25-29', '30-34', '35-39', '40-44', '45-49', '50+', 'Unknown'],
+        age_band
+    ) AS age_band_sort,
+    CASE
+        WHEN LOWER(sex_value) LIKE '%female%' THEN 'Female'
+        WHEN LOWER(sex_value) LIKE '%male%' THEN 'Male'
+        ELSE 'Unknown'
+    END AS sex_group
+FROM age_bands;
+
+CREATE UNIQUE INDEX IF NOT EXISTS mv_measles_entity_age_sex_entity_idx
+    ON dwh.mv_measles_entity_age_sex (entity_id);
@@ -0,0 +1,37 @@
+-- Refresh the dashboard's derived tables and materialized views.
+-- Schedule after each warehouse load, e.g. from cron:
+--   0 2 * * * psql -d uganda_dwh -f /home/user/hisp/schema/refresh.sql
+
+REFRESH MATERIALIZED VIEW CONCURRENTLY dwh.dim_valid_districts;
+REFRESH MATERIALIZED VIEW CONCURRENTLY dwh.dim_data_elements;
+REFRESH MATERIALIZED VIEW CONCURRENTLY dwh.mv_measles_events;
+ANALYZE dwh.mv_measles_events;
+REFRESH MATERIALIZED VIEW CONCURRENTLY dwh.mv_measles_demographics;
+ANALYZE dwh.mv_measles_demographics;
+REFRESH MATERIALIZED VIEW CONCURRENTLY dwh.mv_measles_entity_age_sex;
+ANALYZE dwh.mv_measles_entity_age_sex;
+
+-- Rebuild the daily district rollup atomically; readers see the old rows until COMMIT
+BEGIN;
+DELETE FROM dwh.fact_measles_daily_district;
+INSERT INTO dwh.fact_measles_daily_district (event_date, district_name, region_name, cases)
+SELECT
+    me.event_date,
+    vd.district_name,
+    MAX(doh.region_name) AS region_name,
+    COUNT(*) AS cases
+FROM (
+    SELECT
+        e.event_id,
+        MAX(e.event_date) AS event_date,
+        MAX(e.dim_org_hierarchy_key) AS dim_org_hierarchy_key
+    FROM dwh.mv_measles_events e
+    WHERE e.event_date IS NOT NULL
+    GROUP BY e.event_id
+) me
+JOIN dwh.dim_valid_districts vd ON me.dim_org_hierarchy_key = vd.dim_org_hierarchy_key
+JOIN dwh.dim_eidsr_org_hierarchy doh ON me.dim_org_hierarchy_key = doh.dim_org_hierarchy_key
+GROUP BY me.event_date, vd.district_name;
+COMMIT;
+
+ANALYZE dwh.fact_measles_daily_district;
@@ -0,0 +1,27 @@
+-- Pre-aggregated rollup tables used by the measles dashboard.
+-- Apply once with: psql -d uganda_dwh -f schema/rollups.sql
+-- Populated by schema/refresh.sql after each warehouse load.
+
+-- Measles cases per district per day. The choropleth maps and the top-district
+-- epicurves read this table, so they aggregate roughly districts x days rows instead
+-- of every event in the fact table.
+CREATE TABLE IF NOT EXISTS dwh.fact_measles_daily_district (
+    event_date    DATE    NOT NULL,
+    district_name TEXT    NOT NULL,
+    cases         INTEGER NOT NULL,
+    PRIMARY KEY (event_date, district_name)
+);
+
+-- Per-district lookups (the epicurves filter a handful of districts over a date range)
+CREATE INDEX IF NOT EXISTS fact_measles_daily_district_name_idx
+    ON dwh.fact_measles_daily_district (district_name, event_date) INCLUDE (cases);
+
+-- Region of each district, so the district proportion charts can apply a region
+-- selection to this table instead of re-aggregating the events
+ALTER TABLE dwh.fact_measles_daily_district ADD COLUMN IF NOT EXISTS region_name TEXT;
+CREATE INDEX IF NOT EXISTS fact_measles_daily_district_region_idx
+    ON dwh.fact_measles_daily_district (region_name, event_date) INCLUDE (district_name, cases);
+
+-- Location filters match districts with ILIKE '%name%'; pg_trgm is created by indexes.sql
+CREATE INDEX IF NOT EXISTS fact_measles_daily_district_name_trgm_idx
+    ON dwh.fact_measles_daily_district USING gin (district_name gin_trgm_ops);